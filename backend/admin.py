@@ -1,7 +1,53 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from .models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Contact, Order, OrderItem
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц
+
+    Для списка без фильтров на PostgreSQL вместо SELECT COUNT(*) берется оценка
+    из pg_class.reltuples, если в таблице больше ESTIMATE_THRESHOLD строк.
+    """
+    ESTIMATE_THRESHOLD = 1_000_000
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+        if connection.vendor == 'postgresql' and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                               [query.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > self.ESTIMATE_THRESHOLD:
+                return row[0]
+        return super().count
+
+class OnlyFieldsChangeList(ChangeList):
+    """
+    Список объектов админки с выборкой только колонок из list_only_fields админки
+    """
+
+    def get_queryset(self, request, *args, **kwargs):
+        return super().get_queryset(request, *args, **kwargs).only(*self.model_admin.list_only_fields)
+
+class ListOnlyFieldsMixin:
+    """
+    Миксин админки: колонки ограничиваются через only() только на странице списка
+
+    Формы изменения и удаления получают объекты со всеми колонками, иначе каждое
+    отложенное поле загружалось бы отдельным запросом.
+    """
+    list_only_fields = ()
+
+    def get_changelist(self, request, **kwargs):
+        return OnlyFieldsChangeList
+
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
     """
@@ -49,16 +95,28 @@ class ProductParameterInline(admin.TabularInline):
     """
     model = ProductParameter
     extra = 1
+    autocomplete_fields = ('parameter',)
 
 @admin.register(ProductInfo)
-class ProductInfoAdmin(admin.ModelAdmin):
+class ProductInfoAdmin(ListOnlyFieldsMixin, admin.ModelAdmin):
     """
     Админка для модели ProductInfo
     """
     list_display = ('product', 'shop', 'price', 'quantity', 'price_rrc')
+    list_select_related = ('product', 'shop')
     list_filter = ('shop',)
     search_fields = ('product__name', 'shop__name')
     inlines = [ProductParameterInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Колонки, нужные для списка
+    list_only_fields = ('id', 'product__name', 'shop__name', 'price', 'quantity', 'price_rrc')
+
+    def get_queryset(self, request):
+        """
+        Подгрузка продукта и магазина, которые выводятся в названии объекта
+        """
+        return super().get_queryset(request).select_related('product', 'shop')
 
 @admin.register(Parameter)
 class ParameterAdmin(admin.ModelAdmin):
@@ -76,6 +134,8 @@ class ProductParameterAdmin(admin.ModelAdmin):
     list_display = ('product_info', 'parameter', 'value')
     list_filter = ('parameter',)
     search_fields = ('product_info__product__name', 'parameter__name')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
@@ -100,16 +160,31 @@ class OrderAdmin(admin.ModelAdmin):
     Админка для модели Order
     """
     list_display = ('id', 'user', 'dt', 'status', 'contact')
+    list_select_related = ('user', 'contact')
     list_filter = ('status', 'dt')
     search_fields = ('user__username', 'contact__city')
     readonly_fields = ('dt',)
     inlines = [OrderItemInline]
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(ListOnlyFieldsMixin, admin.ModelAdmin):
     """
     Админка для модели OrderItem
     """
     list_display = ('order', 'product_info', 'quantity')
+    list_select_related = ('order', 'product_info__product')
     list_filter = ('order__status',)
     search_fields = ('order__user__username', 'product_info__product__name')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Колонки, нужные для списка
+    list_only_fields = (
+        'id', 'quantity', 'order__dt', 'order__status',
+        'product_info__quantity', 'product_info__price', 'product_info__product__name'
+    )
+
+    def get_queryset(self, request):
+        """
+        Подгрузка заказа и товара, которые выводятся в названии объекта
+        """
+        return super().get_queryset(request).select_related('order', 'product_info__product')
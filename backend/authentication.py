@@ -0,0 +1,104 @@
+import hashlib
+import hmac
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+# Время жизни записи об успешной аутентификации в кэше (в секундах)
+AUTH_CACHE_TIMEOUT = 30
+# Время жизни ID пользователя, найденного по токену, в кэше (в секундах)
+TOKEN_USER_CACHE_TIMEOUT = 300
+
+
+def token_user_cache_key(token_key):
+    """
+    Функция получения ключа кэша для ID пользователя, найденного по токену
+    """
+    return f'authtoken_user:{token_key}'
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    Бэкенд аутентификации с кэшированием успешных проверок пароля
+
+    Проверка пароля хешером намеренно медленная. Повторный вход с теми же учетными данными
+    и с того же IP в течение AUTH_CACHE_TIMEOUT секунд не вызывает хешер: в кэше хранятся
+    ID пользователя и HMAC хеша его пароля. Запись действует, только пока хеш пароля в БД
+    не изменился. Ни учетные данные, ни хеш пароля в кэш не попадают - только их HMAC.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        """
+        Аутентификация пользователя с проверкой кэша
+
+        Args:
+            request: HTTP-запрос (нужен для IP клиента; без него кэш не используется)
+            username: Имя пользователя
+            password: Пароль
+
+        Return:
+            User или None
+        """
+        if request is None or username is None or password is None:
+            return super().authenticate(request, username=username, password=password, **kwargs)
+
+        key = self.get_cache_key(request, username, password)
+        cached = cache.get(key)
+        if cached is not None:
+            user_id, password_digest = cached
+            user = get_user_model()._default_manager.filter(pk=user_id).first()
+            if (user is not None and hmac.compare_digest(self.get_password_digest(user), password_digest)
+                    and self.user_can_authenticate(user)):
+                return user
+            cache.delete(key)
+
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is not None:
+            cache.set(key, (user.pk, self.get_password_digest(user)), AUTH_CACHE_TIMEOUT)
+        return user
+
+    @staticmethod
+    def get_password_digest(user):
+        """
+        HMAC хеша пароля пользователя на SECRET_KEY
+        """
+        return hmac.new(settings.SECRET_KEY.encode(), user.password.encode(), hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def get_cache_key(request, username, password):
+        """
+        Ключ кэша: HMAC от учетных данных на SECRET_KEY и IP клиента
+        """
+        digest = hmac.new(
+            settings.SECRET_KEY.encode(), f'{username}\0{password}'.encode(), hashlib.sha256
+        ).hexdigest()
+        return f"authok:{digest}:{request.META.get('REMOTE_ADDR', '')}"
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену DRF с кэшированием ID пользователя
+
+    TokenAuthentication на каждый запрос выполняет SELECT по таблице токенов с JOIN пользователя.
+    Здесь в кэше (Redis) по ключу токена хранится только ID пользователя, а сам пользователь
+    выбирается из БД по первичному ключу. Поэтому в кэш не попадают хеш пароля и другие данные
+    пользователя, а представления получают актуальный объект. Запись сбрасывается сигналами
+    при изменении или удалении токена.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_user_cache_key(key)
+        user_id = cache.get(cache_key)
+        if user_id is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, user.pk, TOKEN_USER_CACHE_TIMEOUT)
+            return user, token
+
+        user = get_user_model()._default_manager.filter(pk=user_id).first()
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        # Токен повторно не выбирается из БД: request.auth в приложении служит только признаком аутентификации
+        return user, self.get_model()(key=key, user=user)
@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Min
+from backend.models import Parameter, Product, ProductInfo, ProductParameter
+
+class Command(BaseCommand):
+    """
+    Management command для объединения дублей параметров и продуктов
+
+    Параметры с одинаковым названием и продукты с одинаковыми названием и категорией
+    сливаются в запись с наименьшим ID. Команда запускается перед migrate, который добавляет
+    уникальность Parameter.name и Product(name, category): при дублях в БД миграция не применится.
+    """
+
+    help = 'Объединение дублей параметров и продуктов перед миграцией ограничений уникальности'
+
+    def add_arguments(self, parser):
+        """
+        Функция для определения аргументов командной строки для этой команды
+
+        Аргументы:
+            - parser - ArgumentParser объект для добавления аргументов
+        """
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет объединено, без изменения БД'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Основной метод, который выполняется при запуске команды
+
+        Все объединения выполняются в одной транзакции, при --dry-run она откатывается.
+        Продукты, которые нельзя объединить без потери товаров магазина, пропускаются
+        и выводятся в конце вместе с ошибкой команды.
+        """
+        dry_run = options.get('dry_run')
+
+        with transaction.atomic():
+            parameters_merged = self.merge_parameters()
+            products_merged, conflicts = self.merge_products()
+            if dry_run:
+                transaction.set_rollback(True)
+
+        prefix = 'Будет объединено' if dry_run else 'Объединено'
+        self.stdout.write(f'{prefix} параметров: {parameters_merged}')
+        self.stdout.write(f'{prefix} продуктов: {products_merged}')
+
+        if conflicts:
+            for product_id, keep_id in conflicts:
+                self.stderr.write(self.style.ERROR(
+                    f'Продукт {product_id} не объединен с {keep_id}: у одного магазина есть товары обоих продуктов'
+                ))
+            raise CommandError('Остались дубли продуктов, объедините их товары вручную и запустите команду снова')
+
+        self.stdout.write(self.style.SUCCESS('Дублей не осталось, можно выполнять migrate'))
+
+    def merge_parameters(self):
+        """
+        Объединение параметров с одинаковым названием
+
+        Значения дубля переносятся на оставляемый параметр. Если у товара уже есть значение
+        оставляемого параметра, значение дубля удаляется.
+
+        Возвращает: int - количество удаленных дублей
+        """
+        merged = 0
+        groups = Parameter.objects.order_by().values('name').annotate(keep_id=Min('id'), count=Count('id'))
+        for group in groups.filter(count__gt=1):
+            duplicate_ids = Parameter.objects.filter(name=group['name']).exclude(id=group['keep_id'])
+            for duplicate_id in duplicate_ids.values_list('id', flat=True):
+                values = ProductParameter.objects.filter(parameter_id=duplicate_id)
+                values.filter(product_info__product_parameters__parameter_id=group['keep_id']).delete()
+                values.update(parameter_id=group['keep_id'])
+                Parameter.objects.filter(id=duplicate_id).delete()
+                merged += 1
+        return merged
+
+    def merge_products(self):
+        """
+        Объединение продуктов с одинаковыми названием и категорией
+
+        Товары магазинов переносятся на оставляемый продукт. Если у магазина есть товары
+        обоих продуктов, на них могут ссылаться заказы, поэтому такой дубль не объединяется.
+
+        Возвращает: tuple (merged: int, conflicts: list of (ID дубля, ID оставляемого продукта))
+        """
+        merged = 0
+        conflicts = []
+        groups = Product.objects.order_by().values('name', 'category').annotate(keep_id=Min('id'), count=Count('id'))
+        for group in groups.filter(count__gt=1):
+            duplicates = Product.objects.filter(name=group['name'], category=group['category'])
+            for duplicate_id in duplicates.exclude(id=group['keep_id']).values_list('id', flat=True):
+                product_infos = ProductInfo.objects.filter(product_id=duplicate_id)
+                if product_infos.filter(shop__product_infos__product_id=group['keep_id']).exists():
+                    conflicts.append((duplicate_id, group['keep_id']))
+                    continue
+                product_infos.update(product_id=group['keep_id'])
+                Product.objects.filter(id=duplicate_id).delete()
+                merged += 1
+        return merged, conflicts
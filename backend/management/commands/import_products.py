@@ -1,7 +1,12 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from backend.models import Shop, Category, Parameter, Product, ProductInfo, ProductParameter
-from backend.utils import load_yaml_from_file, load_yaml_from_url
+from django.db import connection, transaction
+from backend.models import Shop
+from backend.utils import (
+    load_yaml_from_file, load_yaml_from_url, insert_goods,
+    get_parameter_ids, get_product_ids, upsert_categories, link_categories_to_shop,
+    delete_shop_product_infos, invalidate_view_cache, CATEGORIES_CACHE_PREFIX, PRODUCTS_CACHE_PREFIX
+)
 
 class Command(BaseCommand):
     """
@@ -12,6 +17,8 @@ class Command(BaseCommand):
 
     help = 'Импорт товаров из YAML-файла или URL'
 
+    CHUNK_SIZE = 5000 # Количество товаров, сохраняемых в одной транзакции
+
     def add_arguments(self, parser):
         """
         Функция для определения аргументов командной строки для это команды
@@ -40,6 +47,12 @@ class Command(BaseCommand):
             type=int,
             help='ID пользователя-владельца магазина'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Количество потоков для параллельной загрузки товаров (только PostgreSQL)'
+        )
     
     def handle(self, *args, **options):
         """
@@ -61,6 +74,7 @@ class Command(BaseCommand):
         url = options.get('url')
         shop_name = options.get('shop')
         user_id = options.get('user_id')
+        workers = options.get('workers')
 
         try:
             if file_path: # Проверка источника жанных
@@ -76,7 +90,7 @@ class Command(BaseCommand):
             
             self.stdout.write(f'Начало импорта для магазина: {shop_name}')
 
-            success, message = self.import_data(data, shop_name, user_id) # Вызов основного метода импорта
+            success, message = self.import_data(data, shop_name, user_id, workers) # Вызов основного метода импорта
 
             if success:
                 self.stdout.write(self.style.SUCCESS(message)) #Если импорт успешен - зеленое сообщение
@@ -88,95 +102,82 @@ class Command(BaseCommand):
         except Exception as e:
             self.stderr.write(self.style.ERROR(f'Другая ошибка: {str(e)}'))
 
-    @transaction.atomic
-    def import_data(self, data, shop_name, user_id):
+    def import_data(self, data, shop_name, user_id, workers=1):
         """
         Основная логика импорта данных
 
-        Используется транзакция: либо все операции выполняются упешно, либо все изменения откатываются при ошибке
+        Импорт разбит на этапы, каждый в своей транзакции, а товары сохраняются пачками
+        по CHUNK_SIZE штук. Так транзакции остаются короткими, не держат блокировки на всё
+        время импорта, а при ошибке сохраняются уже загруженные пачки. На PostgreSQL пачки
+        загружаются параллельно в нескольких потоках.
 
         Аргументы:
             - data (dict): Данные из YAML-файла
             - shop_name (str): Название магазина
             - user_id (int): ID пользователя владельца
+            - workers (int): Количество потоков для загрузки товаров
 
         Возвращает: tuple (success: bool, message: str)
 
         Процесс:
-        1. Создание/получение магазина.
-        2. Обработка категорий.
-        3. Удаление старых товаров магазина.
-        4. Обработка товаров и их параметров
+        1. Создание/получение магазина и обработка категорий.
+        2. Удаление старых товаров магазина.
+        3. Создание продуктов и параметров.
+        4. Загрузка товаров и их параметров пачками
         """
 
         try:
-            # Работа с магазином
-
-            shop, created = Shop.objects.get_or_create(name=shop_name, 
-                                                       defaults={'user_id': user_id} if user_id else {})
-            if created:
-                self.stdout.write(f'Создан новый магазин: {shop_name}')
-            else:
-                self.stdout.write(f'Найден существующий магазин: {shop_name}')
+            # Работа с магазином и категориями
+            with transaction.atomic():
+                shop, created = Shop.objects.get_or_create(name=shop_name, 
+                                                           defaults={'user_id': user_id} if user_id else {})
+                if created:
+                    self.stdout.write(f'Создан новый магазин: {shop_name}')
+                else:
+                    self.stdout.write(f'Найден существующий магазин: {shop_name}')
 
-            # Обработка категорий
-            for category_data in data['categories']: # Проходим по всем категориям из YAML
-                category, cat_created = Category.objects.get_or_create( #Создаю или получаю категорию по ID
-                    id=category_data['id'], # ID из YAML
-                    defaults={'name': category_data['name']}
-                )
+                # Обработка категорий: создание и обновление одним запросом, ID берутся из YAML
+                category_ids = upsert_categories(data['categories'])
+                self.stdout.write(f'Обработано категорий: {len(category_ids)}')
 
-                # Связываем категорию с магазином
-                category.shops.add(shop)
-                category.save()
+                # Связываем категории с магазином одним запросом
+                link_categories_to_shop(category_ids, shop)
 
-                if cat_created:
-                    self.stdout.write(f'Создана категори: {category.name}')
+            # bulk_create не отправляет сигналы, поэтому кэш списка категорий сбрасывается явно
+            invalidate_view_cache(CATEGORIES_CACHE_PREFIX)
 
             # Очистка старых данных
             # Удаляем все существующие товары этого магазина, чтобы обнвоить весь ассортимент
-            deleted_count = ProductInfo.objects.filter(shop_id=shop.id).delete()[0]
+            with transaction.atomic():
+                deleted_count = delete_shop_product_infos(shop.id)
             self.stdout.write(f'Удалено старых товаров: {deleted_count}')
 
             #Обработка товаров
 
-            #Счетчики для статистики
-            products_created = 0
-            parameters_created = 0
-
-            for item in data['goods']:
-                # Создание или получение основного продукта
-                product, prod_created = Product.objects.get_or_create(
-                    name=item['name'],
-                    category_id=item['category'] # связыаем с категорией
+            # Справочники продуктов и параметров собираются заранее - в цикле только поиск по словарю
+            with transaction.atomic():
+                product_ids, products_created = get_product_ids(
+                    (item['name'], item['category']) for item in data['goods']
                 )
-                if prod_created:
-                    products_created += 1
-
-                # ProductInfo - конкретное предложение товара в конкретном магазине. Здесь хранится цена, количество...
-                product_info = ProductInfo.objects.create(
-                    product_id=product.id, #ссылка на основной продукт
-                    shop_id=shop.id, #ссылка на магазин
-                    external_id=item['id'], # ID из внешней системы
-                    model=item['model'], #Модель товара
-                    price=item['price'], # Цена
-                    price_rrc=item['price_rrc'], #Рекомендованная цена
-                    quantity=item['quantity'] # Количество на складе
+                parameter_ids = get_parameter_ids(
+                    name for item in data['goods'] for name in item.get('parameters', {})
                 )
 
-                # Проходим по всем характеристикам товара
-                for param_name, param_value in item['parameters'].items():
-                    # Создаем или получаем параметр по названию
-                    parameter_object, _ = Parameter.objects.get_or_create(name=param_name)
+            goods = data['goods']
+            chunks = [goods[start:start + self.CHUNK_SIZE] for start in range(0, len(goods), self.CHUNK_SIZE)]
+            # Продукты и параметры уже созданы, поэтому пачки не конфликтуют друг с другом
+            if connection.vendor != 'postgresql':
+                workers = 1
 
-                    #Создаем связь параметра с товаром
-                    ProductParameter.objects.create(
-                        product_info_id=product_info.id,
-                        parameter_id=parameter_object.id,
-                        value=str(param_value)
-                    )
+            parameters_created = 0
+            goods_loaded = 0
+            for chunk, chunk_parameters in self.import_goods_chunks(chunks, shop, product_ids, parameter_ids, workers):
+                parameters_created += chunk_parameters
+                goods_loaded += len(chunk)
+                self.stdout.write(f'Загружено товаров: {goods_loaded} из {len(goods)}')
 
-                    parameters_created += 1
+            # Товары загружаются пачками в отдельных транзакциях - кэш списка товаров сбрасывается после всех пачек
+            invalidate_view_cache(PRODUCTS_CACHE_PREFIX)
 
             self.stdout.write(f'Создано новых продуктов: {products_created}')
             self.stdout.write(f'Создано параметров: {parameters_created}')
@@ -188,3 +189,71 @@ class Command(BaseCommand):
             return False, f'Отсутствует обязательное поле в данных: {str(e)}'
         except Exception as e:
             return False, f"Ошибка импорта: {str(e)}"
+
+    def import_goods_chunks(self, chunks, shop, product_ids, parameter_ids, workers):
+        """
+        Загрузка пачек товаров последовательно или в пуле потоков
+
+        Аргументы:
+            - chunks (list): Пачки товаров из YAML-файла
+            - shop (Shop): Магазин
+            - product_ids (dict): ID продуктов по паре (название, ID категории)
+            - parameter_ids (dict): ID параметров по названию
+            - workers (int): Количество потоков
+
+        Возвращает: генератор пар (пачка, количество созданных параметров) по мере загрузки
+
+        Каждая пачка сохраняется в своей транзакции. При ошибке в одной из пачек загрузка
+        оставшихся прекращается, уже сохраненные пачки остаются в БД.
+        """
+        if workers <= 1 or len(chunks) <= 1:
+            for committed, chunk in enumerate(chunks):
+                try:
+                    chunk_parameters = self.import_goods_chunk(chunk, shop, product_ids, parameter_ids)
+                except Exception:
+                    self.stderr.write(f'Импорт прерван, сохранено пачек: {committed} из {len(chunks)}')
+                    raise
+                yield chunk, chunk_parameters
+            return
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            futures = {
+                executor.submit(self.import_goods_chunk_in_thread, chunk, shop, product_ids, parameter_ids): chunk
+                for chunk in chunks
+            }
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            except Exception:
+                # При первой ошибке пачки из очереди отменяются, дожидаемся только уже запущенных
+                executor.shutdown(cancel_futures=True)
+                committed = sum(1 for future in futures if not future.cancelled() and future.exception() is None)
+                self.stderr.write(f'Импорт прерван, сохранено пачек: {committed} из {len(chunks)}')
+                raise
+
+    def import_goods_chunk_in_thread(self, goods, shop, product_ids, parameter_ids):
+        """
+        Загрузка пачки товаров в отдельном потоке
+
+        Подключения Django к БД привязаны к потоку, поэтому по завершении работы
+        подключение потока закрывается.
+        """
+        try:
+            return self.import_goods_chunk(goods, shop, product_ids, parameter_ids)
+        finally:
+            connection.close()
+
+    @transaction.atomic
+    def import_goods_chunk(self, goods, shop, product_ids, parameter_ids):
+        """
+        Загрузка пачки товаров и их параметров в одной транзакции
+
+        Аргументы:
+            - goods (list): Товары из YAML-файла
+            - shop (Shop): Магазин
+            - product_ids (dict): ID продуктов по паре (название, ID категории)
+            - parameter_ids (dict): ID параметров по названию
+
+        Возвращает: количество созданных параметров товаров
+        """
+        return insert_goods(goods, shop.id, product_ids, parameter_ids)
@@ -0,0 +1,119 @@
+from functools import lru_cache
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+@lru_cache(maxsize=None)
+def get_related_lookups(serializer_class, model):
+    """
+    Функция построения списков связей для select_related и prefetch_related по полям сериализатора
+
+    Обходит поля сериализатора (включая вложенные сериализаторы и источники с точками,
+    например source='product.category.name') и по полю модели определяет тип связи:
+    ForeignKey/OneToOne подгружаются через JOIN (select_related), обратные FK и ManyToMany -
+    отдельными запросами (prefetch_related). Дополнительно собирается список колонок для only():
+    поля основной модели и моделей, подгружаемых через JOIN. Если набор нужных колонок
+    определить нельзя (есть SerializerMethodField, свойство модели и т.п.), вместо списка
+    возвращается None. Результат кэшируется для пары (сериализатор, модель).
+
+    Args:
+        serializer_class: Класс сериализатора
+        model: Модель, объекты которой сериализуются
+
+    Return:
+        tuple: (связи для select_related, связи для prefetch_related, поля для only() или None)
+    """
+    select_related = []
+    prefetch_related = []
+    only_fields = []
+    only_allowed = _collect_lookups(serializer_class(), model, '', False, select_related, prefetch_related, only_fields)
+    # Одна связь может встретиться в нескольких полях - повторы убираются с сохранением порядка
+    select_related, prefetch_related, only_fields = (
+        tuple(dict.fromkeys(lookups)) for lookups in (select_related, prefetch_related, only_fields)
+    )
+    return select_related, prefetch_related, only_fields if only_allowed else None
+
+
+def _collect_lookups(serializer, model, prefix, in_prefetch, select_related, prefetch_related, only_fields):
+    """
+    Рекурсивный обход полей сериализатора для get_related_lookups
+
+    Return:
+        bool: можно ли ограничить выборку полями only_fields
+    """
+    only_allowed = True
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+            # Какие колонки нужны такому полю, заранее не известно
+            only_allowed = False
+            continue
+
+        # Источник с точками (source='product.category.name') проходится по связям до последнего атрибута
+        current_model, current_prefix, current_in_prefetch = model, prefix, in_prefetch
+        attrs = field.source.split('.')
+        for position, attr in enumerate(attrs, start=1):
+            try:
+                model_field = current_model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                only_allowed = False
+                break
+
+            lookup = current_prefix + attr
+            if not model_field.is_relation:
+                if not current_in_prefetch:
+                    only_fields.append(lookup)
+                break
+
+            is_many = model_field.many_to_many or model_field.one_to_many
+            # Внутри prefetch-связи JOIN невозможен - дальнейшие связи тоже подгружаются через prefetch
+            if is_many or current_in_prefetch:
+                prefetch_related.append(lookup)
+            else:
+                select_related.append(lookup)
+                only_fields.append(lookup)
+            current_in_prefetch = current_in_prefetch or is_many
+
+            if position < len(attrs):
+                current_model, current_prefix = model_field.related_model, lookup + '__'
+                continue
+
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(nested, serializers.BaseSerializer):
+                only_allowed &= _collect_lookups(nested, model_field.related_model, lookup + '__',
+                                                 current_in_prefetch, select_related, prefetch_related, only_fields)
+            elif not current_in_prefetch:
+                # Поле-связь без вложенного сериализатора (StringRelatedField и т.п.) - нужны все колонки
+                # связанной модели, поэтому она подгружается через JOIN без ограничения полей
+                only_allowed = False
+    return only_allowed
+
+
+class AutoPrefetchMixin:
+    """
+    Миксин для generic-представлений DRF, устраняющий N+1 запросы
+
+    Дополняет queryset представления вызовами select_related/prefetch_related
+    для всех связей, которые отображает serializer_class, и ограничивает выборку
+    через only() колонками, которые сериализатор выводит.
+    """
+
+    def get_queryset(self):
+        """
+        Queryset представления с подгрузкой связанных объектов
+
+        Return:
+            QuerySet: queryset с select_related/prefetch_related/only по полям сериализатора
+        """
+        queryset = super().get_queryset()
+        select_related, prefetch_related, only_fields = get_related_lookups(
+            self.get_serializer_class(), queryset.model
+        )
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if only_fields is not None:
+            queryset = queryset.only(*only_fields)
+        return queryset
@@ -36,6 +36,9 @@ class Shop(models.Model):
         verbose_name = 'Магазин'
         verbose_name_plural = 'Список магазинов'
         ordering = ['-name']
+        indexes = [
+            models.Index(fields=['name'], name='shop_name_idx')
+        ]
 
     def __str__(self):
         return self.name
@@ -67,6 +70,9 @@ class Product(models.Model):
         verbose_name = 'Продукт'
         verbose_name_plural = 'Список продуктов'
         ordering = ['-name']
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'category'], name='unique_product')
+        ]
     
     def __str__(self):
         return self.name
@@ -90,6 +96,10 @@ class ProductInfo(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop'], name='unique_product_info')
         ]
+        indexes = [
+            models.Index(fields=['shop', 'external_id'], name='product_info_shop_ext_id_idx'),
+            models.Index(fields=['shop', 'quantity'], name='product_info_shop_qty_idx')
+        ]
 
     def __str__(self):
         return f'{self.product.name}: количество: {self.quantity}, цена: {self.price}'
@@ -98,7 +108,7 @@ class Parameter(models.Model):
     """
     Модель параметра
     """
-    name = models.CharField(max_length=100, verbose_name='Название параметра')
+    name = models.CharField(max_length=100, unique=True, verbose_name='Название параметра')
 
     class Meta:
         verbose_name = 'Название параметра'
@@ -170,10 +180,16 @@ class Order(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = 'Список заказов'
         ordering = ['status', '-dt']
+        indexes = [
+            models.Index(fields=['-dt', 'status'], name='order_dt_status_idx')
+        ]
 
     def __str__(self):
         return f'Заказ от {self.dt}, статус - {self.status}'
 
+# Допустимые статусы заказа для проверки входных данных без построения словаря на каждый запрос
+VALID_ORDER_STATES = frozenset(state for state, _ in Order.STATE_CHOISES)
+
 class OrderItem(models.Model):
     """
     Модель заказанных позиций
@@ -190,6 +206,9 @@ class OrderItem(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['order_id', 'product_info'], name='unique_order_item')
         ]
+        indexes = [
+            models.Index(fields=['product_info', 'order'], name='order_item_product_order_idx')
+        ]
 
     def __str__(self):
         return f'Позиция заказа {self.order.id}: {self.product_info.product.name}'
@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация по убыванию ID
+
+    Страница выбирается условием по ID вместо OFFSET, поэтому время запроса не растет
+    с номером страницы. Ответ: {'next': ..., 'previous': ..., 'results': [...]}
+    """
+    ordering = '-id'
+    page_size = 50
+
+
+class DtCursorPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация заказов по убыванию даты создания
+    """
+    ordering = '-dt'
+    page_size = 50
@@ -0,0 +1,29 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON-рендерер на orjson
+
+    Кодирование выполняется в C-расширении orjson. Типы, которые orjson не поддерживает
+    (Decimal, ленивые строки переводов и т.п.), а также datetime передаются в encoder_class DRF,
+    поэтому формат ответа совпадает со стандартным JSONRenderer. Запросы с отступами
+    (indent в Accept или Browsable API) рендерятся стандартным JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        )
+        # Как и JSONRenderer, экранируем U+2028 и U+2029, чтобы ответ оставался подмножеством JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
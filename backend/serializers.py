@@ -1,8 +1,33 @@
+from decimal import Decimal
 from rest_framework import serializers
-from django.contrib.auth import authenticate
+from rest_framework.settings import api_settings
+from django.db import connection
+from django.db.models import JSONField, Prefetch
+from django.db.models.expressions import RawSQL
 from django.contrib.auth.password_validation import validate_password
 from .models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, Contact
 
+class PriceField(serializers.DecimalField):
+    """
+    Поле цены только для чтения
+
+    Цена из БД уже хранится с нужным количеством знаков после запятой, поэтому
+    повторное округление (quantize) DecimalField не выполняется - значение сразу
+    форматируется в строку
+    """
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_digits', 10)
+        kwargs.setdefault('decimal_places', 2)
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        coerce_to_string = getattr(self, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        if (coerce_to_string and not self.localize and isinstance(value, Decimal)
+                and value.as_tuple().exponent == -self.decimal_places):
+            return f'{value:f}'
+        return super().to_representation(value)
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Сериализатор для модели User: для отображения информации о пользователе
@@ -103,13 +128,53 @@ class ProductInfoSerializer(serializers.ModelSerializer):
     """
     product = ProductSerializer(read_only=True)
     shop = ShopSerializer(read_only=True)
-    parameters = ProductParameterSerializer(source='product_parameters', many=True, read_only=True)
+    price = PriceField()
+    price_rrc = PriceField()
+    parameters = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductInfo
         fields = ('id', 'product', 'shop', 'external_id', 'model', 'price', 'price_rrc', 'quantity', 'parameters')
         read_only_fields = ('id',)
 
+    @classmethod
+    def prefetch_queryset(cls, queryset):
+        """
+        Подгрузка связей, которые выводит сериализатор, для queryset ProductInfo
+
+        Продукт с категорией и магазин подгружаются через JOIN. Параметры на PostgreSQL
+        собираются в JSON (parameters_json) одним подзапросом jsonb_agg на строку,
+        на остальных СУБД подгружаются через prefetch_related. В обоих случаях параметры
+        упорядочены по id.
+
+        Return:
+            QuerySet: queryset со связями и параметрами продуктов
+        """
+        queryset = queryset.select_related('product__category', 'shop')
+        if connection.vendor != 'postgresql':
+            return queryset.prefetch_related(
+                Prefetch('product_parameters', queryset=ProductParameter.objects.select_related('parameter').order_by('id'))
+            )
+
+        parameters_sql = f"""
+            SELECT COALESCE(jsonb_agg(jsonb_build_object('parameter', p.name, 'value', pp.value) ORDER BY pp.id), '[]'::jsonb)
+            FROM {ProductParameter._meta.db_table} pp
+            JOIN {Parameter._meta.db_table} p ON p.id = pp.parameter_id
+            WHERE pp.product_info_id = {ProductInfo._meta.db_table}.id
+        """
+        return queryset.annotate(parameters_json=RawSQL(parameters_sql, [], output_field=JSONField()))
+
+    def get_parameters(self, obj):
+        """
+        Параметры продукта
+
+        Если queryset аннотирован готовым JSON параметров (parameters_json), он отдается как есть,
+        иначе параметры сериализуются из связанных объектов
+        """
+        if hasattr(obj, 'parameters_json'):
+            return obj.parameters_json
+        return ProductParameterSerializer(obj.product_parameters.all(), many=True).data
+
 class OrderItemSerializer(serializers.ModelSerializer):
     """
     Сериализатор для элементов заказа
@@ -137,12 +202,14 @@ class OrderItemCreateSerializer(serializers.ModelSerializer):
 class OrderSerializer(serializers.ModelSerializer):
     """
     Сериализатор для заказов.
-    Включает элементы заказа и контактную информацию.
+    Включает элементы заказа, контактную информацию и сумму заказа.
     """
     ordered_items = OrderItemSerializer(many=True, read_only=True)
     contact = ContactSerializer(read_only=True)
+    # Сумма заказа аннотируется в queryset (total_sum), без аннотации поле не выводится
+    total_sum = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = Order
-        fields = ('id', 'dt', 'status', 'contact', 'ordered_items')
+        fields = ('id', 'dt', 'status', 'contact', 'ordered_items', 'total_sum')
         read_only_fields = ('id',)
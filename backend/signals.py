@@ -0,0 +1,54 @@
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import token_user_cache_key
+from .models import Category, Contact, Shop, User
+from .utils import (
+    CATEGORIES_CACHE_PREFIX, SHOPS_CACHE_PREFIX, contacts_cache_key, invalidate_view_cache, token_cache_key
+)
+
+
+@receiver(post_save, sender=User)
+def invalidate_token_cache(sender, instance, **kwargs):
+    """
+    Сброс закэшированного токена при изменении пользователя (в том числе смене пароля)
+    """
+    cache.delete(token_cache_key(instance.id))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token_user_cache(sender, instance, **kwargs):
+    """
+    Сброс закэшированных токена и пользователя при создании, изменении или удалении токена
+    """
+    cache.delete_many([token_user_cache_key(instance.key), token_cache_key(instance.user_id)])
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+def invalidate_shops_cache(sender, **kwargs):
+    """
+    Сброс закэшированного списка магазинов при изменении магазина
+    """
+    invalidate_view_cache(SHOPS_CACHE_PREFIX)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(m2m_changed, sender=Category.shops.through)
+def invalidate_categories_cache(sender, **kwargs):
+    """
+    Сброс закэшированного списка категорий при изменении категории
+    """
+    invalidate_view_cache(CATEGORIES_CACHE_PREFIX)
+
+
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+def invalidate_contacts_cache(sender, instance, **kwargs):
+    """
+    Сброс закэшированного списка контактов пользователя при добавлении, изменении или удалении контакта
+    """
+    cache.delete(contacts_cache_key(instance.user_id))
@@ -4,9 +4,33 @@ Celery задачи для приложения backend.
 Содержит асинхронные задачи для отправки email и импорта товаров.
 """
 
+from string import Template
 from celery import shared_task
-from django.core.mail import send_mail
+from celery.utils.log import get_task_logger
+from django.core.mail import EmailMessage, get_connection, send_mail
 from django.conf import settings
+from django_redis import get_redis_connection
+from .models import Order
+
+logger = get_task_logger(__name__)
+
+# Список Redis с письмами подтверждения заказов, ожидающими отправки
+PENDING_ORDER_EMAILS_KEY = 'pending_order_emails'
+# Максимальное количество писем, отправляемых за один запуск пакетной задачи
+ORDER_EMAILS_BATCH_SIZE = 500
+
+# Шаблоны письма подтверждения заказа
+_ORDER_CONFIRMATION_SUBJECT = 'Подтверждение заказа #{order_id}'
+_ORDER_CONFIRMATION_BODY = Template('''
+Уважаемый(ая) $name!
+
+Ваш заказ #$order_id подтвержден. Спасибо за покупку!
+
+Мы уведомим вас о статусе заказа.
+
+С уважением,
+Команда магазина
+        ''')
 
 @shared_task
 def debug_task():
@@ -18,52 +42,122 @@ def debug_task():
     """
     return 'Celery работает корректно!'
 
-@shared_task(bind=True, max_retries=3)
-def send_order_confirmation_email(self, order_id, user_email, user_name):
+@shared_task(ignore_result=True)
+def send_order_confirmation_email(order_id):
     """
-    Асинхронная задача для отправки email подтверждения заказа.
+    Постановка email подтверждения заказа в очередь на отправку.
+
+    Письмо не отправляется сразу: ID заказа добавляется в список Redis,
+    который периодически разбирает задача send_order_confirmation_emails_batch.
+    Данные получателя читаются из БД при отправке. Результат задачи не хранится:
+    он означает только постановку в очередь, а не отправку письма.
     
     Args:
         order_id: ID заказа
-        user_email: Email пользователя
-        user_name: Имя пользователя
         
     Return:
-        dict: Результат отправки email
+        dict: Результат постановки в очередь
     """
-    try:
-        subject = f'Подтверждение заказа #{order_id}'
-        message = f'''
-Уважаемый(ая) {user_name}!
+    get_redis_connection('default').lpush(PENDING_ORDER_EMAILS_KEY, order_id)
+    return {
+        'status': 'queued',
+        'message': f'Email для заказа #{order_id} поставлен в очередь',
+        'order_id': order_id
+    }
 
-Ваш заказ #{order_id} подтвержден. Спасибо за покупку!
+def _pop_pending_order_emails(limit):
+    """
+    Извлечение из очереди Redis не более limit самых старых писем
 
-Мы уведомим вас о статусе заказа.
+    Чтение и удаление выполняются в одной транзакции (MULTI/EXEC), поэтому
+    параллельные задачи не получат одни и те же письма.
 
-С уважением,
-Команда магазина
-        '''
-        
-        # Отправка email
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user_email],
-            fail_silently=False,
-        )
-        
-        return {
-            'status': 'success',
-            'message': f'Email отправлен на {user_email}',
-            'order_id': order_id
-        }
+    Return:
+        list: ID заказов в порядке постановки
+    """
+    pipe = get_redis_connection('default').pipeline()
+    pipe.lrange(PENDING_ORDER_EMAILS_KEY, -limit, -1)
+    pipe.ltrim(PENDING_ORDER_EMAILS_KEY, 0, -limit - 1)
+    items, _ = pipe.execute()
+    # LPUSH добавляет в начало списка - самые старые письма в конце
+    return [int(item) for item in reversed(items)]
+
+def _build_order_confirmation_message(order):
+    """
+    Формирование письма подтверждения заказа по шаблонам модуля
+    """
+    user = order.user
+    return EmailMessage(
+        subject=_ORDER_CONFIRMATION_SUBJECT.format(order_id=order.id),
+        body=_ORDER_CONFIRMATION_BODY.substitute(name=user.get_full_name() or user.username, order_id=order.id),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.email]
+    )
+
+@shared_task(bind=True, max_retries=3, ignore_result=True)
+def send_order_confirmation_emails_batch(self, order_ids=None):
+    """
+    Пакетная отправка email подтверждения заказов.
+
+    Запускается Celery beat по расписанию: забирает накопившиеся в очереди Redis
+    ID заказов, одним запросом читает заказы с пользователями и отправляет письма
+    через одно SMTP-соединение. Отправка отслеживается по каждому письму: при ошибках
+    задача повторяется только с неотправленными заказами, поэтому отправленные письма
+    не дублируются. Заказы, письма которых не удалось отправить после всех попыток,
+    записываются в лог.
+    
+    Args:
+        order_ids: Список ID заказов; если не передан - берется из очереди
         
+    Return:
+        dict: Результат отправки email
+    """
+    if order_ids is None:
+        order_ids = _pop_pending_order_emails(ORDER_EMAILS_BATCH_SIZE)
+    if not order_ids:
+        return {'status': 'success', 'message': 'Нет писем для отправки', 'sent': 0}
+
+    orders = Order.objects.filter(id__in=order_ids).select_related('user').only(
+        'id', 'user__username', 'user__email', 'user__first_name', 'user__last_name'
+    )
+    messages = {order.id: _build_order_confirmation_message(order) for order in orders}
+    if not messages:  # Заказы удалены до отправки
+        return {'status': 'success', 'message': 'Нет писем для отправки', 'sent': 0}
+
+    sent_ids = []
+    failed_ids = []
+    error = None
+    try:
+        # Одно SMTP-соединение на все письма пачки, каждое письмо отправляется отдельно,
+        # чтобы знать, какие из них уже доставлены
+        with get_connection(fail_silently=False) as connection:
+            for order_id, message in messages.items():
+                try:
+                    connection.send_messages([message])
+                except Exception as e:
+                    failed_ids.append(order_id)
+                    error = e
+                else:
+                    sent_ids.append(order_id)
     except Exception as e:
-        # Повторная попытка через 60 секунд
-        raise self.retry(exc=e, countdown=60)
+        # Соединение не открылось или оборвалось: неотправленными считаются все письма без подтверждения
+        failed_ids = [order_id for order_id in messages if order_id not in sent_ids]
+        error = e
+
+    if failed_ids:
+        if self.request.retries < self.max_retries:
+            # Повторная попытка через 60 секунд только с неотправленными письмами
+            raise self.retry(exc=error, countdown=60, kwargs={'order_ids': failed_ids})
+        logger.error('Не удалось отправить письма подтверждения заказов %s: %s', failed_ids, error)
+
+    return {
+        'status': 'success' if not failed_ids else 'partial',
+        'message': f'Отправлено писем: {len(sent_ids)}',
+        'order_ids': sent_ids,
+        'failed_order_ids': failed_ids
+    }
 
-@shared_task(bind=True, max_retries=3)
+@shared_task(bind=True, max_retries=3, ignore_result=True)
 def send_email(self, subject, message, recipient_list, from_email=None):
     """
     Универсальная задача для отправки email.
@@ -1,3 +1,242 @@
-from django.test import TestCase
+import io
+from unittest import mock
+import yaml
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+from .authentication import CachedModelBackend, CachedTokenAuthentication, token_user_cache_key
+from .models import Order, User
+from .tasks import send_order_confirmation_emails_batch
+from .utils import iter_yaml_items, token_cache_key
 
-# Create your tests here.
+
+PRICE_LIST = '''
+shop: Связной
+categories:
+  - id: 224
+    name: Смартфоны
+  - id: 15
+    name: Аксессуары
+goods:
+  - id: 4216292
+    category: 224
+    model: apple/iphone/xs-max
+    name: Смартфон Apple iPhone XS Max 512GB (золотистый)
+    price: 110000
+    price_rrc: 116990
+    quantity: 14
+    parameters:
+      "Диагональ (дюйм)": 6.5
+      "Разрешение (пикс)": 2688x1242
+      "Встроенная память (Гб)": 512
+      "Цвет": золотистый
+  - id: 4216313
+    category: 15
+    model: apple/airpods
+    name: Наушники Apple AirPods
+    price: 13000
+    price_rrc: 13990
+    quantity: 3
+    parameters: {}
+'''
+
+
+def parse(text):
+    return list(iter_yaml_items(io.StringIO(text)))
+
+
+class IterYamlItemsTests(SimpleTestCase):
+    """
+    Тесты потокового разбора YAML-прайс-листа
+    """
+
+    def test_items_match_full_load(self):
+        data = yaml.safe_load(PRICE_LIST)
+        expected = [('shop', data['shop'])]
+        expected += [('categories', category) for category in data['categories']]
+        expected += [('goods', item) for item in data['goods']]
+        self.assertEqual(parse(PRICE_LIST), expected)
+
+    def test_keys_keep_file_order(self):
+        items = parse('goods:\n  - id: 1\ncategories:\n  - id: 2\nshop: Связной\n')
+        self.assertEqual(items, [('goods', {'id': 1}), ('categories', {'id': 2}), ('shop', 'Связной')])
+
+    def test_nested_mappings_and_sequences(self):
+        text = 'goods:\n  - id: 1\n    parameters:\n      size: {w: 1, h: [2, 3]}\n      tags: [a, b]\n'
+        self.assertEqual(parse(text), [('goods', yaml.safe_load(text)['goods'][0])])
+
+    def test_empty_document(self):
+        self.assertEqual(parse(''), [])
+
+    def test_top_level_must_be_mapping(self):
+        with self.assertRaises(yaml.YAMLError):
+            parse('- id: 1\n')
+
+    def test_alias_is_not_supported(self):
+        with self.assertRaises(yaml.YAMLError):
+            parse('categories:\n  - &first {id: 1}\n  - *first\n')
+
+
+class FlakyEmailConnection:
+    """
+    Тестовое SMTP-соединение: запоминает отправленные письма, письма на адреса
+    из fail_once не отправляет при первой попытке
+    """
+
+    def __init__(self, fail_once=(), fail_always=()):
+        self.sent = []
+        self.fail_once = set(fail_once)
+        self.fail_always = set(fail_always)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def send_messages(self, messages):
+        for message in messages:
+            address = message.to[0]
+            if address in self.fail_always:
+                raise OSError('SMTP недоступен')
+            if address in self.fail_once:
+                self.fail_once.discard(address)
+                raise OSError('SMTP недоступен')
+            self.sent.append(address)
+        return len(messages)
+
+
+class OrderConfirmationEmailsBatchTests(TestCase):
+    """
+    Тесты пакетной отправки писем подтверждения заказов
+    """
+
+    def setUp(self):
+        self.orders = [
+            Order.objects.create(
+                user=User.objects.create_user(f'buyer{i}', f'buyer{i}@example.com', 'password'),
+                status='confirmed'
+            )
+            for i in range(3)
+        ]
+        self.order_ids = [order.id for order in self.orders]
+
+    def send(self, connection):
+        with mock.patch('backend.tasks.get_connection', return_value=connection):
+            return send_order_confirmation_emails_batch.apply(kwargs={'order_ids': self.order_ids})
+
+    def test_all_messages_sent_once(self):
+        connection = FlakyEmailConnection()
+        result = self.send(connection)
+        self.assertEqual(sorted(connection.sent), [f'buyer{i}@example.com' for i in range(3)])
+        self.assertEqual(sorted(result.result['order_ids']), sorted(self.order_ids))
+
+    def test_retry_resends_only_failed_messages(self):
+        connection = FlakyEmailConnection(fail_once={'buyer1@example.com'})
+        self.send(connection)
+        # Каждое письмо доставлено ровно один раз, повтор отправил только письмо с ошибкой
+        self.assertEqual(sorted(connection.sent), [f'buyer{i}@example.com' for i in range(3)])
+        self.assertEqual(connection.sent[-1], 'buyer1@example.com')
+
+    def test_failed_messages_reported_after_retries(self):
+        connection = FlakyEmailConnection(fail_always={'buyer2@example.com'})
+        with mock.patch('backend.tasks.logger') as logger:
+            result = self.send(connection)
+        self.assertEqual(sorted(connection.sent), ['buyer0@example.com', 'buyer1@example.com'])
+        self.assertEqual(result.result['failed_order_ids'], [self.orders[2].id])
+        logger.error.assert_called_once()
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CachedModelBackendTests(TestCase):
+    """
+    Тесты кэширования успешных проверок пароля
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.backend = CachedModelBackend()
+        self.request = RequestFactory().post('/api/user/login/')
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+
+    def authenticate(self, password='password'):
+        return self.backend.authenticate(self.request, username='buyer', password=password)
+
+    def test_cache_hit_skips_password_check(self):
+        self.assertEqual(self.authenticate(), self.user)
+        with mock.patch('django.contrib.auth.backends.ModelBackend.authenticate') as authenticate:
+            self.assertEqual(self.authenticate(), self.user)
+        authenticate.assert_not_called()
+
+    def test_password_hash_is_not_cached(self):
+        self.authenticate()
+        key = self.backend.get_cache_key(self.request, 'buyer', 'password')
+        user_id, password_digest = cache.get(key)
+        self.assertEqual(user_id, self.user.pk)
+        self.assertNotIn(password_digest, self.user.password)
+
+    def test_password_change_invalidates_entry(self):
+        self.authenticate()
+        self.user.set_password('new-password')
+        self.user.save()
+        self.assertIsNone(self.authenticate())
+        self.assertEqual(self.authenticate('new-password'), self.user)
+
+    def test_inactive_user_is_rejected(self):
+        self.authenticate()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(self.authenticate())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CachedTokenAuthenticationTests(TestCase):
+    """
+    Тесты кэширования пользователя по токену и сброса кэша сигналами
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.authentication = CachedTokenAuthentication()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.token = Token.objects.create(user=self.user)
+
+    def test_only_user_id_is_cached(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(cache.get(token_user_cache_key(self.token.key)), self.user.pk)
+
+    def test_cache_hit_loads_fresh_user(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        User.objects.filter(pk=self.user.pk).update(first_name='Иван')
+        with self.assertNumQueries(1):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(user.first_name, 'Иван')
+        self.assertEqual(token.key, self.token.key)
+
+    def test_inactive_user_is_rejected(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_token_delete_invalidates_cache(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        cache.set(token_cache_key(self.user.pk), self.token.key)
+        self.token.delete()
+        self.assertIsNone(cache.get(token_user_cache_key(self.token.key)))
+        self.assertIsNone(cache.get(token_cache_key(self.user.pk)))
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_token_save_invalidates_cache(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        self.token.save()
+        self.assertIsNone(cache.get(token_user_cache_key(self.token.key)))
+
+    def test_user_save_invalidates_issued_token(self):
+        cache.set(token_cache_key(self.user.pk), self.token.key)
+        self.user.save()
+        self.assertIsNone(cache.get(token_cache_key(self.user.pk)))
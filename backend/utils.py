@@ -1,25 +1,387 @@
+import io
 import yaml
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
+from django.db import connection
+from rest_framework.authtoken.models import Token
+from backend.models import Category, OrderItem, Parameter, Product, ProductInfo, ProductParameter
 
-def load_yaml_from_url(url):
+try:
+    # Загрузчик на C (libyaml) в разы быстрее загрузчика на чистом Python
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Минимальное количество строк, начиная с которого вставка идет через COPY
+COPY_THRESHOLD = 100
+# Размер пачки строк при потоковом чтении больших выборок
+ITERATOR_CHUNK_SIZE = 2000
+# Количество строк в одном INSERT при bulk_create товаров
+BULK_CREATE_BATCH_SIZE = 1000
+# Время жизни токена аутентификации в кэше (в секундах), токен сбрасывается сигналами при изменении
+TOKEN_CACHE_TIMEOUT = 60 * 60 * 24
+# Время жизни закэшированного списка контактов пользователя (в секундах), список сбрасывается сигналами при изменении
+CONTACTS_CACHE_TIMEOUT = 60 * 60
+# Время жизни закэшированных ответов списков магазинов, категорий и товаров (в секундах)
+VIEW_CACHE_TIMEOUT = 60 * 5
+# Префиксы ключей кэша для списков магазинов, категорий и товаров
+SHOPS_CACHE_PREFIX = 'shops'
+CATEGORIES_CACHE_PREFIX = 'categories'
+PRODUCTS_CACHE_PREFIX = 'products'
+# Таймаут HTTP-запроса при загрузке YAML по URL (в секундах)
+REQUEST_TIMEOUT = 30
+
+_URL_VALIDATOR = URLValidator()
+# Общая HTTP-сессия: соединения с серверами поставщиков переиспользуются между загрузками,
+# временные ошибки повторяются с экспоненциальной задержкой
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=Retry(total=3, backoff_factor=0.3))
+_SESSION.mount('http://', _ADAPTER)
+_SESSION.mount('https://', _ADAPTER)
+
+def _open_url(url):
     """
-    Функция загрузки YAML по URL
+    Функция открытия потокового HTTP-ответа по URL
+
+    Возвращает: requests.Response, тело которого читается из response.raw
     """
-    validate_url = URLValidator()
     try:
-        validate_url(url)
+        _URL_VALIDATOR(url)
     except ValidationError as e:
         raise ValueError(f'Invalid URL: {e}')
-    
-    response = requests.get(url)
+
+    response = _SESSION.get(url, stream=True, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
-    return yaml.safe_load(response.content)
+    response.raw.decode_content = True
+    return response
+
+def load_yaml_from_url(url):
+    """
+    Функция загрузки YAML по URL
+    """
+    # Тело ответа читается парсером напрямую из сокета, без промежуточной копии в памяти.
+    # После разбора ответ закрывается и соединение возвращается в пул сессии
+    with _open_url(url) as response:
+        return yaml.load(response.raw, Loader=SafeLoader)
 
 def load_yaml_from_file(file_path):
     """
     Функция загрузки YAML из файла
     """
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return yaml.safe_load(file)
+    # Файл открывается в бинарном режиме: libyaml сам декодирует байты, без промежуточного декодирования в str
+    with open(file_path, 'rb') as file:
+        return yaml.load(file, Loader=SafeLoader)
+
+def _compose_node(loader):
+    """
+    Функция сборки узла YAML из событий парсера
+
+    Повторяет Composer из PyYAML, который недоступен у загрузчика на C. Якоря и ссылки (&, *)
+    в прайс-листах не используются и не поддерживаются.
+
+    Возвращает: yaml.Node
+    """
+    event = loader.get_event()
+    if isinstance(event, yaml.ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        return yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+
+    if isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+        is_sequence = isinstance(event, yaml.SequenceStartEvent)
+        node_class, end_event = (yaml.SequenceNode, yaml.SequenceEndEvent) if is_sequence \
+            else (yaml.MappingNode, yaml.MappingEndEvent)
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(node_class, None, event.implicit)
+        value = []
+        while not loader.check_event(end_event):
+            value.append(_compose_node(loader) if is_sequence else (_compose_node(loader), _compose_node(loader)))
+        end_mark = loader.get_event().end_mark
+        return node_class(tag, value, event.start_mark, end_mark, flow_style=event.flow_style)
+
+    raise yaml.YAMLError(f'Неподдерживаемая конструкция YAML: {event}')
+
+def iter_yaml_items(stream):
+    """
+    Функция потокового разбора YAML-документа со словарем на верхнем уровне
+
+    Списки верхнего уровня (categories, goods) разбираются по одному элементу: в памяти
+    находится только текущий элемент, а не весь документ.
+
+    Возвращает: генератор пар (ключ верхнего уровня, элемент списка), для значений,
+    которые не являются списками, - пар (ключ, значение)
+    """
+    loader = SafeLoader(stream)
+    try:
+        loader.get_event()  # Начало потока
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        loader.get_event()  # Начало документа
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise yaml.YAMLError('На верхнем уровне YAML-документа ожидается словарь')
+        loader.get_event()
+
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = loader.construct_document(_compose_node(loader))
+            if not loader.check_event(yaml.SequenceStartEvent):
+                yield key, loader.construct_document(_compose_node(loader))
+                continue
+            loader.get_event()
+            while not loader.check_event(yaml.SequenceEndEvent):
+                yield key, loader.construct_document(_compose_node(loader))
+            loader.get_event()
+    finally:
+        loader.dispose()
+
+def iter_yaml_items_from_url(url):
+    """
+    Функция потокового разбора YAML по URL
+
+    Элементы разбираются по мере загрузки тела ответа, см. iter_yaml_items.
+
+    Возвращает: генератор пар (ключ верхнего уровня, элемент списка или значение)
+    """
+    with _open_url(url) as response:
+        yield from iter_yaml_items(response.raw)
+
+def _copy_value(value):
+    """
+    Функция преобразования значения в формат text для COPY
+    """
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def copy_insert(objects):
+    """
+    Функция массовой вставки объектов одной модели через COPY FROM STDIN
+
+    На PostgreSQL для пачек больше COPY_THRESHOLD строк выполняется одна команда COPY,
+    иначе используется bulk_create. ID созданных строк в объекты не возвращаются.
+
+    Возвращает: количество вставленных строк
+    """
+    if not objects:
+        return 0
+
+    model = type(objects[0])
+    if connection.vendor != 'postgresql' or len(objects) <= COPY_THRESHOLD:
+        model.objects.bulk_create(objects, batch_size=5000)
+        return len(objects)
+
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    buffer = io.StringIO()
+    for obj in objects:
+        buffer.write('\t'.join(
+            _copy_value(field.get_db_prep_save(getattr(obj, field.attname), connection))
+            for field in fields
+        ))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY {quote_name(model._meta.db_table)} ({columns}) FROM STDIN', buffer)
+    return len(objects)
+
+def get_parameter_ids(names):
+    """
+    Функция получения ID параметров по их названиям
+
+    Недостающие параметры создаются одним INSERT ... ON CONFLICT DO NOTHING (название уникально,
+    поэтому параллельные импорты не создают дублей), затем ID всех параметров выбираются одним запросом.
+    Строки вставляются в отсортированном порядке, чтобы параллельные импорты блокировали их
+    в одной последовательности и не попадали во взаимную блокировку.
+
+    Возвращает: dict {название параметра: ID}
+    """
+    names = set(names)
+    if not names:
+        return {}
+    Parameter.objects.bulk_create([Parameter(name=name) for name in sorted(names)], ignore_conflicts=True)
+    return dict(Parameter.objects.filter(name__in=names).values_list('name', 'id'))
+
+def get_product_ids(keys):
+    """
+    Функция получения ID продуктов по паре (название, ID категории)
+
+    Существующие продукты выбираются одним запросом, недостающие создаются одним
+    INSERT ... ON CONFLICT DO NOTHING в отсортированном порядке: продукт, созданный параллельным
+    импортом, не дублируется (пара название/категория уникальна). Результаты выборок читаются
+    потоково (на PostgreSQL - серверным курсором) пачками по ITERATOR_CHUNK_SIZE.
+
+    Возвращает: tuple (dict {(название, ID категории): ID}, количество созданных продуктов)
+    """
+    keys = set(keys)
+    existing = Product.objects.filter(name__in={name for name, _ in keys}).values_list(
+        'name', 'category_id', 'id'
+    ).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    product_ids = {(name, category_id): pk for name, category_id, pk in existing if (name, category_id) in keys}
+    missing = keys - product_ids.keys()
+    if missing:
+        Product.objects.bulk_create(
+            [Product(name=name, category_id=category_id) for name, category_id in sorted(missing)],
+            ignore_conflicts=True
+        )
+        created = Product.objects.filter(name__in={name for name, _ in missing}).values_list(
+            'name', 'category_id', 'id'
+        ).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        product_ids.update({(name, category_id): pk for name, category_id, pk in created if (name, category_id) in missing})
+    return product_ids, len(missing)
+
+def insert_goods(goods, shop_id, product_ids, parameter_ids):
+    """
+    Функция сохранения товаров магазина вместе с их параметрами
+
+    Товары (ProductInfo) вставляются через bulk_create (на PostgreSQL ID возвращаются сразу),
+    параметров на порядок больше - они загружаются через copy_insert. Продукты и параметры
+    должны быть созданы заранее (get_product_ids, get_parameter_ids).
+
+    Возвращает: количество созданных параметров товаров
+    """
+    product_infos = [
+        ProductInfo(
+            product_id=product_ids[(item['name'], item['category'])],
+            shop_id=shop_id,
+            external_id=item['id'],
+            model=item['model'],
+            price=item['price'],
+            price_rrc=item['price_rrc'],
+            quantity=item['quantity']
+        )
+        for item in goods
+    ]
+    ProductInfo.objects.bulk_create(product_infos, batch_size=BULK_CREATE_BATCH_SIZE)
+
+    # ID товаров известны после bulk_create, str() только для не строковых значений
+    product_parameters = [
+        ProductParameter(
+            product_info_id=product_info.id,
+            parameter_id=parameter_ids[name],
+            value=value if type(value) is str else str(value)
+        )
+        for item, product_info in zip(goods, product_infos)
+        for name, value in item.get('parameters', {}).items()
+    ]
+    return copy_insert(product_parameters)
+
+def upsert_categories(categories_data):
+    """
+    Функция создания/обновления категорий из данных YAML
+
+    Все категории сохраняются одним INSERT ... ON CONFLICT: новые создаются,
+    у существующих обновляется название. Повторы ID убираются (остается последнее название),
+    строки идут по возрастанию ID, чтобы параллельные импорты разных магазинов блокировали
+    общие категории в одном порядке и не попадали во взаимную блокировку.
+
+    Возвращает: list ID категорий по возрастанию
+    """
+    names = {category_data['id']: category_data['name'] for category_data in categories_data}
+    categories = [Category(id=category_id, name=names[category_id]) for category_id in sorted(names)]
+    Category.objects.bulk_create(categories, update_conflicts=True, update_fields=['name'], unique_fields=['id'])
+    return [category.id for category in categories]
+
+def link_categories_to_shop(category_ids, shop):
+    """
+    Функция привязки категорий к магазину
+
+    Все связи вставляются в промежуточную таблицу одним INSERT по возрастанию ID категорий,
+    уже существующие пропускаются.
+    """
+    through = Category.shops.through
+    through.objects.bulk_create(
+        [through(category_id=category_id, shop_id=shop.id) for category_id in sorted(set(category_ids))],
+        ignore_conflicts=True
+    )
+
+def delete_shop_product_infos(shop_id):
+    """
+    Функция удаления всех товаров магазина вместе с зависимыми строками
+
+    Вместо Collector Django выполняются прямые DELETE-запросы: объекты не загружаются в память,
+    сигналы удаления не отправляются. Зависимые параметры и позиции заказов удаляются так же,
+    как при каскадном удалении.
+
+    Возвращает: количество удаленных записей ProductInfo
+    """
+    quote_name = connection.ops.quote_name
+    product_info_table = quote_name(ProductInfo._meta.db_table)
+    product_info_ids = f'SELECT id FROM {product_info_table} WHERE shop_id = %s'
+
+    with connection.cursor() as cursor:
+        for model in (ProductParameter, OrderItem):
+            cursor.execute(
+                f'DELETE FROM {quote_name(model._meta.db_table)} WHERE product_info_id IN ({product_info_ids})',
+                [shop_id]
+            )
+        cursor.execute(f'DELETE FROM {product_info_table} WHERE shop_id = %s', [shop_id])
+        return cursor.rowcount
+
+def token_cache_key(user_id):
+    """
+    Функция получения ключа кэша для токена пользователя
+    """
+    return f'authtoken:{user_id}'
+
+def contacts_cache_key(user_id):
+    """
+    Функция получения ключа кэша для списка контактов пользователя
+    """
+    return f'contacts:{user_id}'
+
+def get_or_issue_token(user_id):
+    """
+    Функция получения ключа токена пользователя, токен создается при отсутствии
+
+    На PostgreSQL выполняется один запрос INSERT ... ON CONFLICT ... RETURNING вместо
+    SELECT + INSERT в get_or_create. Существующий токен не меняется: при конфликте
+    UPDATE оставляет прежний ключ и нужен только для того, чтобы RETURNING вернул строку.
+
+    Возвращает: str ключ токена
+    """
+    if connection.vendor != 'postgresql':
+        token, created = Token.objects.get_or_create(user_id=user_id)
+        return token.key
+
+    table = connection.ops.quote_name(Token._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (key, user_id, created) VALUES (%s, %s, NOW()) '
+            f'ON CONFLICT (user_id) DO UPDATE SET key = {table}.key RETURNING key',
+            [Token.generate_key(), user_id]
+        )
+        return cursor.fetchone()[0]
+
+def get_or_create_token_cached(user):
+    """
+    Функция получения токена аутентификации пользователя с кэшированием
+
+    Ключ токена сначала ищется в кэше (Redis), к БД обращение идет только при промахе:
+    токен берется или создается через get_or_issue_token и сохраняется в кэш.
+
+    Возвращает: str ключ токена
+    """
+    key = token_cache_key(user.id)
+    token_key = cache.get(key)
+    if token_key is None:
+        token_key = get_or_issue_token(user.id)
+        cache.set(key, token_key, TOKEN_CACHE_TIMEOUT)
+    return token_key
+
+def invalidate_view_cache(key_prefix):
+    """
+    Функция удаления всех закэшированных через cache_page ответов с указанным key_prefix
+
+    cache_page хранит заголовки и тело ответа под ключами вида
+    views.decorators.cache.cache_header.<key_prefix>.<...> и
+    views.decorators.cache.cache_page.<key_prefix>.<...>, поэтому удаляются оба набора ключей.
+    """
+    cache.delete_pattern(f'views.decorators.cache.cache_*.{key_prefix}.*')
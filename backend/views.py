@@ -1,4 +1,3 @@
-from django.shortcuts import render
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAuthenticated
@@ -7,18 +6,62 @@ from .serializers import (
     CategorySerializer, ShopSerializer, ContactSerializer, OrderSerializer,
     OrderItemCreateSerializer
 )
-from rest_framework.authtoken.models import Token
 from rest_framework import status
 from django.contrib.auth import authenticate
 from rest_framework.generics import ListAPIView, RetrieveAPIView
+from django.core.cache import cache
 from django.db import transaction
-from django.core.mail import send_mail
-from django.conf import settings
-from .models import Category, ProductInfo, Shop, Contact, Order, OrderItem, Product
+from django.db.models import (
+    Case, DecimalField, Exists, F, OuterRef, PositiveIntegerField, Prefetch, Sum, Value, When
+)
+from django.db.models.functions import Coalesce
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_page
+from django.views.decorators.vary import vary_on_headers
+from .models import Category, ProductInfo, Shop, Contact, Order, OrderItem, VALID_ORDER_STATES
 from .tasks import send_order_confirmation_email
+from .mixins import AutoPrefetchMixin
+from .pagination import IdCursorPagination
+from .utils import (
+    get_or_create_token_cached, contacts_cache_key, CONTACTS_CACHE_TIMEOUT, VIEW_CACHE_TIMEOUT,
+    SHOPS_CACHE_PREFIX, CATEGORIES_CACHE_PREFIX, PRODUCTS_CACHE_PREFIX
+)
 from celery.result import AsyncResult
 
 
+def _order_qs():
+    """
+    Queryset заказов с подгрузкой всего, что выводит OrderSerializer
+
+    Контакт подгружается через JOIN, позиции заказа и их товары - prefetch-запросами,
+    товары - со связями и параметрами из ProductInfoSerializer.prefetch_queryset.
+    Из самого заказа читаются только выводимые колонки.
+
+    Return:
+        QuerySet: queryset Order с подгруженными связями
+    """
+    return Order.objects.only('id', 'dt', 'status', 'contact').select_related('contact').prefetch_related(
+        Prefetch('ordered_items', queryset=OrderItem.objects.prefetch_related(
+            Prefetch('product_info', queryset=ProductInfoSerializer.prefetch_queryset(ProductInfo.objects.all()))
+        ))
+    )
+
+
+def _with_total_sum(queryset):
+    """
+    Аннотация суммы заказа для queryset Order
+
+    Сумма (количество * цена по всем позициям) считается в БД одним GROUP BY.
+
+    Return:
+        QuerySet: queryset с полем total_sum
+    """
+    return queryset.annotate(total_sum=Coalesce(
+        Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price')),
+        Value(0),
+        output_field=DecimalField(max_digits=12, decimal_places=2)
+    ))
+
 
 class RegisterView(APIView):
     """
@@ -32,6 +75,7 @@ class RegisterView(APIView):
     """
     permission_classes = [AllowAny] # Класс разрешения с неограниченным доступом
 
+    @transaction.atomic
     def post(self, request):
         """
         Регистрация нового пользователя в системе
@@ -45,14 +89,14 @@ class RegisterView(APIView):
 
         serializer = UserRegisterSerializer(data=request.data)
 
-        if serializer.is_valid():  # ⭐ ИСПРАВИТЬ: добавить скобки ()
+        if serializer.is_valid():
             user = serializer.save() # Сохраняем пользователя в БД, если прошла валидация
-            token, created = Token.objects.get_or_create(user=user) # Создается токен
+            token_key = get_or_create_token_cached(user) # Создается токен
 
             return Response({
                 'Status': True,
                 'Message': 'Пользователь успешно зарегистрирован',
-                'Token': token.key
+                'Token': token_key
             }, status=status.HTTP_201_CREATED)
         
         return Response({
@@ -85,13 +129,13 @@ class LoginView(APIView):
         username = request.data.get('username')
         password = request.data.get('password')
 
-        user = authenticate(username=username, password=password) # Если аутенцифицирует - возвращает User, в обратном - None
+        user = authenticate(request, username=username, password=password) # Если аутенцифицирует - возвращает User, в обратном - None
 
         if user is not None:
-            token, created = Token.objects.get_or_create(user=user)
+            token_key = get_or_create_token_cached(user) # Токен берется из кэша, при промахе - из БД
             return Response({
                 'Status': True,
-                'Token': token.key
+                'Token': token_key
             })
         
         return Response({
@@ -142,12 +186,15 @@ class UserProfileView(APIView):
             'Errors': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
     
-class ShopListView(ListAPIView):
+@method_decorator(cache_page(VIEW_CACHE_TIMEOUT, key_prefix=SHOPS_CACHE_PREFIX), name='get')
+@method_decorator(vary_on_headers('Authorization'), name='get')
+class ShopListView(AutoPrefetchMixin, ListAPIView):
     """
     API-endpoint для получения списка активных магазинов
 
     Отображает только магазины, которые принимают заказы (is_active=True).
     Доступен без аутентификации для просмотра каталога.
+    Ответ кэшируется на 5 минут и сбрасывается при изменении магазинов.
     
     Методы:
         GET - получение списка магазинов
@@ -157,12 +204,15 @@ class ShopListView(ListAPIView):
     permission_classes = [AllowAny]
 
 
-class CategoryListView(ListAPIView):
+@method_decorator(cache_page(VIEW_CACHE_TIMEOUT, key_prefix=CATEGORIES_CACHE_PREFIX), name='get')
+@method_decorator(vary_on_headers('Authorization'), name='get')
+class CategoryListView(AutoPrefetchMixin, ListAPIView):
     """
     API-endpoint для получения списка категорий товаров
 
     Отображает все категории, доступные в системе.
     Доступен без аутентификации.
+    Ответ кэшируется на 5 минут и сбрасывается при изменении категорий.
     
     Методы:
         GET - получение списка категорий
@@ -171,18 +221,24 @@ class CategoryListView(ListAPIView):
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
 
-class ProductInfoListView(ListAPIView):
+@method_decorator(cache_page(VIEW_CACHE_TIMEOUT, key_prefix=PRODUCTS_CACHE_PREFIX), name='get')
+@method_decorator(vary_on_headers('Authorization'), name='get')
+class ProductInfoListView(AutoPrefetchMixin, ListAPIView):
     """
     API-endpoint для получения списка товаров с фильтрацией
 
     Поддерживает фильтрацию по магазину и категории через query parameters
     Отображает только товары, которые есть в наличии (quantity > 0).
+    Список отдается страницами курсорной пагинации. Ответ кэшируется на 5 минут
+    отдельно для каждого набора параметров запроса и сбрасывается после импорта товаров.
     
     Методы:
         GET - получение списка товаров с возможностью фильтрации
     """
+    queryset = ProductInfo.objects.all()
     serializer_class = ProductInfoSerializer
     permission_classes = [AllowAny]
+    pagination_class = IdCursorPagination
 
     def get_queryset(self):
         """
@@ -191,7 +247,9 @@ class ProductInfoListView(ListAPIView):
         Return:
             QuerySet: Отфильтрованный список товаров
         """
-        queryset = ProductInfo.objects.filter(quantity__gt=0)  # Только товары в наличии
+        queryset = ProductInfoSerializer.prefetch_queryset(
+            super().get_queryset().filter(quantity__gt=0)  # Только товары в наличии
+        )
         
         # Фильтрация по магазину
         shop_id = self.request.query_params.get('shop_id')
@@ -205,7 +263,7 @@ class ProductInfoListView(ListAPIView):
         
         return queryset
 
-class ProductDetailView(RetrieveAPIView):
+class ProductDetailView(AutoPrefetchMixin, RetrieveAPIView):
     """
     API-endpoint для получения детальной информации о конкретном товаре
 
@@ -219,6 +277,15 @@ class ProductDetailView(RetrieveAPIView):
     serializer_class = ProductInfoSerializer
     permission_classes = [AllowAny]
 
+    def get_queryset(self):
+        """
+        Товар с подгруженными продуктом, магазином и параметрами
+
+        Return:
+            QuerySet: Товары с подгруженными связями
+        """
+        return ProductInfoSerializer.prefetch_queryset(super().get_queryset())
+
 class ContactView(APIView):
     """
     API-endpoint для управления контактными данными пользователя
@@ -242,9 +309,13 @@ class ContactView(APIView):
         Return:
             Response: JSON со списком контактов
         """
-        contacts = Contact.objects.filter(user=request.user)
-        serializer = ContactSerializer(contacts, many=True)
-        return Response(serializer.data)
+        # Список контактов берется из кэша, при изменении контактов он сбрасывается сигналами
+        contacts = cache.get_or_set(
+            contacts_cache_key(request.user.id),
+            lambda: ContactSerializer(Contact.objects.filter(user=request.user), many=True).data,
+            CONTACTS_CACHE_TIMEOUT
+        )
+        return Response(contacts)
 
     def post(self, request):
         """
@@ -324,12 +395,13 @@ class BasketView(APIView):
         Return:
             Response: JSON с содержимым корзины или сообщением о пустой корзине
         """
-        basket = Order.objects.filter(user=request.user, status='basket').first()
+        basket = _with_total_sum(_order_qs().filter(user=request.user, status='basket')).first()
         if basket:
             serializer = OrderSerializer(basket)
             return Response(serializer.data)
         return Response({'Status': True, 'Message': 'Корзина пуста'})
 
+    @transaction.atomic
     def post(self, request):
         """
         Добавление товара в корзину пользователя
@@ -355,15 +427,12 @@ class BasketView(APIView):
             product_info = serializer.validated_data['product_info']
             quantity = serializer.validated_data['quantity']
             
-            order_item, created = OrderItem.objects.get_or_create(
-                order=basket,
-                product_info=product_info,
-                defaults={'quantity': quantity}
+            # Количество увеличивается на стороне БД одним UPDATE, без чтения позиции
+            updated = OrderItem.objects.filter(order=basket, product_info=product_info).update(
+                quantity=F('quantity') + quantity
             )
-            
-            if not created:
-                order_item.quantity += quantity
-                order_item.save()
+            if not updated:
+                OrderItem.objects.create(order=basket, product_info=product_info, quantity=quantity)
             
             return Response({
                 'Status': True,
@@ -375,6 +444,7 @@ class BasketView(APIView):
             'Errors': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
 
+    @transaction.atomic
     def patch(self, request):
         """
         Изменение количества товаров в корзине
@@ -387,18 +457,16 @@ class BasketView(APIView):
         """
         items = request.data.get('items')
         if items:
-            basket = Order.objects.filter(user=request.user, status='basket').first()
-            if basket:
-                for item in items:
-                    try:
-                        order_item = OrderItem.objects.get(
-                            id=item['id'],
-                            order=basket
-                        )
-                        order_item.quantity = item['quantity']
-                        order_item.save()
-                    except OrderItem.DoesNotExist:
-                        continue
+            # Нужен только ID корзины - остальные колонки заказа не выбираются
+            basket_id = Order.objects.filter(user=request.user, status='basket').values_list('id', flat=True).first()
+            if basket_id is not None:
+                # Количество всех позиций обновляется одним UPDATE ... CASE, позиции не из корзины пропускаются
+                OrderItem.objects.filter(order_id=basket_id, id__in=[item['id'] for item in items]).update(
+                    quantity=Case(
+                        *[When(id=item['id'], then=Value(item['quantity'])) for item in items],
+                        output_field=PositiveIntegerField()
+                    )
+                )
                 
                 return Response({'Status': True, 'Message': 'Корзина обновлена'})
         
@@ -407,6 +475,7 @@ class BasketView(APIView):
             'Error': 'Не указаны товары для обновления'
         }, status=status.HTTP_400_BAD_REQUEST)
 
+    @transaction.atomic
     def delete(self, request):
         """
         Удаление товаров из корзины
@@ -419,10 +488,16 @@ class BasketView(APIView):
         """
         items = request.data.get('items')
         if items:
-            basket = Order.objects.filter(user=request.user, status='basket').first()
-            if basket:
-                OrderItem.objects.filter(order=basket, id__in=items).delete()
+            # Один DELETE с условием по корзине пользователя, без отдельного запроса корзины
+            deleted, _ = OrderItem.objects.filter(
+                order__user=request.user, order__status='basket', id__in=items
+            ).delete()
+            if deleted:
                 return Response({'Status': True, 'Message': 'Товары удалены из корзины'})
+            return Response({
+                'Status': False,
+                'Error': 'Товары не найдены в корзине'
+            }, status=status.HTTP_404_NOT_FOUND)
         
         return Response({
             'Status': False,
@@ -453,11 +528,14 @@ class OrderView(APIView):
             request: HTTP запрос
             
         Return:
-            Response: JSON со списком заказов пользователя
+            Response: JSON со страницей заказов пользователя (next, previous, results)
         """
-        orders = Order.objects.filter(user=request.user).exclude(status='basket')
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        # Заказы отдаются страницами курсорной пагинации: выбирается и сериализуется не больше page_size заказов
+        orders = _with_total_sum(_order_qs().filter(user=request.user).exclude(status='basket'))
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         """
@@ -481,21 +559,23 @@ class OrderView(APIView):
         
         try:
             with transaction.atomic():
-                # Получаем корзину пользователя
-                basket = Order.objects.filter(user=request.user, status='basket').first()
-                if not basket or not basket.ordered_items.exists():
+                # Корзина блокируется до конца транзакции, наличие позиций проверяется в том же запросе.
+                # EXISTS вместо COUNT: SELECT ... FOR UPDATE несовместим с GROUP BY
+                basket = Order.objects.select_for_update().filter(user=request.user, status='basket').annotate(
+                    has_items=Exists(OrderItem.objects.filter(order=OuterRef('pk')))
+                ).only('id').first()
+                if basket is None or not basket.has_items:
                     return Response({
                         'Status': False,
                         'Error': 'Корзина пуста'
                     }, status=status.HTTP_400_BAD_REQUEST)
                 
                 # Проверяем контакт
-                contact = Contact.objects.get(id=contact_id, user=request.user)
+                if not Contact.objects.filter(id=contact_id, user=request.user).exists():
+                    raise Contact.DoesNotExist
                 
-                # Обновляем заказ
-                basket.contact = contact
-                basket.status = 'new'
-                basket.save()
+                # Обновляем заказ без загрузки объекта
+                Order.objects.filter(id=basket.id).update(contact_id=contact_id, status='new')
                 
                 return Response({
                     'Status': True,
@@ -526,9 +606,9 @@ class OrderDetailView(RetrieveAPIView):
         Ограничение доступа только к заказам текущего пользователя
 
         Return:
-            QuerySet: Заказы текущего пользователя
+            QuerySet: Заказы текущего пользователя с подгруженными связями и суммой заказа
         """
-        return Order.objects.filter(user=self.request.user)
+        return _with_total_sum(_order_qs().filter(user=self.request.user))
 
 class OrderStatusView(APIView):
     """
@@ -553,26 +633,23 @@ class OrderStatusView(APIView):
         Return:
             Response: JSON с результатом операции
         """
-        try:
-            order = Order.objects.get(id=order_id, user=request.user)
-            new_status = request.data.get('status')
-            
-            # Проверяем валидность нового статуса
-            if new_status in dict(Order.STATE_CHOISES):
-                order.status = new_status
-                order.save()
-                return Response({'Status': True, 'Message': 'Статус обновлен'})
-            else:
-                return Response({
-                    'Status': False,
-                    'Error': 'Неверный статус'
-                }, status=status.HTTP_400_BAD_REQUEST)
-                
-        except Order.DoesNotExist:
+        new_status = request.data.get('status')
+        
+        # Проверяем валидность нового статуса
+        if new_status not in VALID_ORDER_STATES:
             return Response({
                 'Status': False,
-                'Error': 'Заказ не найден'
-            }, status=status.HTTP_404_NOT_FOUND)
+                'Error': 'Неверный статус'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Статус обновляется одним UPDATE, без загрузки заказа
+        if Order.objects.filter(id=order_id, user=request.user).update(status=new_status):
+            return Response({'Status': True, 'Message': 'Статус обновлен'})
+        
+        return Response({
+            'Status': False,
+            'Error': 'Заказ не найден'
+        }, status=status.HTTP_404_NOT_FOUND)
 
 class OrderConfirmView(APIView):
     """
@@ -600,17 +677,12 @@ class OrderConfirmView(APIView):
         try:
             order = Order.objects.get(id=order_id, user=request.user)
             
-            # Асинхронная отправка email через Celery
-            task = send_order_confirmation_email.delay(
-                order_id=order.id,
-                user_email=request.user.email,
-                user_name=request.user.get_full_name() or request.user.username
-            )
+            # Письмо ставится в очередь пакетной отправки, данные получателя задача читает из БД
+            send_order_confirmation_email.delay(order_id=order.id)
             
             return Response({
                 'Status': True,
-                'Message': 'Заказ подтвержден, email отправляется',
-                'TaskID': task.id  # ID задачи для отслеживания
+                'Message': 'Заказ подтвержден, email отправляется'
             })
             
         except Order.DoesNotExist:
@@ -622,6 +694,10 @@ class OrderConfirmView(APIView):
 class TaskStatusView(APIView):
     """
     API-endpoint для проверки статуса Celery задач
+
+    Статус отдается сразу, клиент опрашивает endpoint сам. Push-уведомления (Channels, SSE)
+    и long polling не используются: приложение работает через WSGI, где каждое открытое
+    соединение занимает рабочий процесс сервера на все время ожидания.
     """
     permission_classes = [IsAuthenticated]
 
@@ -636,19 +712,19 @@ class TaskStatusView(APIView):
         Return:
             Response: JSON со статусом задачи
         """
-        
         task_result = AsyncResult(task_id)
+        ready = task_result.ready()
         
         response_data = {
             'task_id': task_id,
             'status': task_result.status,
-            'ready': task_result.ready()
+            'ready': ready
         }
         
-        if task_result.ready():
+        if ready:
             if task_result.successful():
                 response_data['result'] = task_result.result
             else:
                 response_data['error'] = str(task_result.result)
         
-        return Response(response_data)
\ No newline at end of file
+        return Response(response_data)
@@ -0,0 +1,36 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import BasePermission
+from backend.models import Shop
+
+
+class SupplierAccessError(APIException):
+    """
+    Ошибка доступа к API поставщика
+
+    Тело ответа в формате остальных ответов API: {'Status': False, 'Error': ...}
+    """
+    status_code = status.HTTP_403_FORBIDDEN
+
+    def __init__(self, error, status_code=None):
+        self.detail = {'Status': False, 'Error': error}
+        if status_code is not None:
+            self.status_code = status_code
+
+
+class IsSupplierWithShop(BasePermission):
+    """
+    Доступ только для поставщиков, у которых есть магазин
+
+    Магазин пользователя выбирается один раз при проверке прав и сохраняется
+    в request.shop, представления берут его оттуда без повторного запроса.
+    """
+
+    def has_permission(self, request, view):
+        if request.user.type != 'supplier':
+            raise SupplierAccessError('Доступно только для поставщиков')
+        # Выбираются только колонки, которые используют представления поставщика
+        request.shop = Shop.objects.filter(user=request.user).only('id', 'name', 'is_active').first()
+        if request.shop is None:
+            raise SupplierAccessError('Магазин не найден для данного пользователя', status.HTTP_404_NOT_FOUND)
+        return True
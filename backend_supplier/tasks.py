@@ -1,12 +1,149 @@
+from functools import partial
+import requests
 from celery import shared_task
 from django.db import transaction
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
-from backend.utils import load_yaml_from_url
+from backend.models import Shop
+from backend.utils import (
+    iter_yaml_items_from_url, insert_goods, get_parameter_ids, get_product_ids, upsert_categories,
+    link_categories_to_shop, delete_shop_product_infos, invalidate_view_cache,
+    CATEGORIES_CACHE_PREFIX, PRODUCTS_CACHE_PREFIX
+)
 
-@shared_task(bind=True, max_retries=3, time_limit=300)
+# Количество товаров, которое копится при разборе YAML перед сохранением в БД
+IMPORT_BATCH_SIZE = 1000
+
+
+def _iter_goods_batches(items, categories):
+    """
+    Группировка товаров из потокового разбора YAML в пачки по IMPORT_BATCH_SIZE
+
+    Категории сохраняются перед первой пачкой товаров, поэтому категория, которая встречается
+    в файле после того, как первая пачка уже отдана, приводит к ValueError (иначе она была бы
+    учтена в статистике, но не сохранена).
+
+    Args:
+        items: Пары (раздел, элемент) из iter_yaml_items_from_url
+        categories: Список, в который складываются категории по мере разбора
+
+    Return:
+        generator: Пачки товаров (list)
+    """
+    goods = []
+    batches_started = False
+    for section, item in items:
+        if section == 'categories':
+            if batches_started:
+                raise ValueError('Категории в прайс-листе должны идти перед товарами')
+            categories.append(item)
+        elif section == 'goods':
+            goods.append(item)
+            if len(goods) >= IMPORT_BATCH_SIZE:
+                batches_started = True
+                yield goods
+                goods = []
+    if goods:
+        yield goods
+
+
+def _prepare_shop(shop, categories):
+    """
+    Сохранение категорий магазина и удаление его старых товаров
+
+    Args:
+        shop: Магазин поставщика
+        categories: Категории из YAML
+
+    Return:
+        int: Количество удаленных товаров
+    """
+    # Обработка категорий: создание/обновление и привязка к магазину - по одному запросу
+    category_ids = upsert_categories(categories)
+    link_categories_to_shop(category_ids, shop)
+    return delete_shop_product_infos(shop.id)
+
+
+def _import_goods_batch(goods, shop_id):
+    """
+    Сохранение пачки товаров магазина вместе с параметрами
+
+    Args:
+        goods: Список товаров из YAML
+        shop_id: ID магазина
+
+    Return:
+        tuple: (количество товаров, количество созданных продуктов, количество параметров)
+    """
+    # Справочники продуктов и параметров: существующие выбираются, недостающие создаются пачкой
+    product_ids, products_created = get_product_ids((item['name'], item['category']) for item in goods)
+    parameter_ids = get_parameter_ids(name for item in goods for name in item.get('parameters', {}))
+    return len(goods), products_created, insert_goods(goods, shop_id, product_ids, parameter_ids)
+
+
+def _import_shop(shop_id, import_url):
+    """
+    Импорт прайс-листа магазина в одной транзакции
+
+    YAML разбирается потоково по мере загрузки: товары сохраняются пачками по IMPORT_BATCH_SIZE,
+    поэтому потребление памяти не зависит от размера прайс-листа. Категории в файле
+    должны идти перед товарами (если товаров не больше IMPORT_BATCH_SIZE, порядок не важен).
+    Строка магазина блокируется до конца транзакции, поэтому импорты одного магазина
+    выполняются по очереди, а не удаляют и вставляют его товары одновременно.
+
+    Args:
+        shop_id: ID магазина поставщика
+        import_url: URL YAML файла с данными товаров
+
+    Return:
+        dict: Результат импорта товаров
+    """
+    with transaction.atomic():
+        shop = Shop.objects.select_for_update().get(id=shop_id)
+
+        categories = []
+        deleted_count = None
+        products_processed = products_created = parameters_processed = 0
+
+        # Категории идут в файле перед товарами, поэтому к первой пачке товаров они уже собраны
+        # (_iter_goods_batches проверяет порядок)
+        for goods in _iter_goods_batches(iter_yaml_items_from_url(import_url), categories):
+            if deleted_count is None:
+                deleted_count = _prepare_shop(shop, categories)
+            batch_products, batch_created, batch_parameters = _import_goods_batch(goods, shop.id)
+            products_processed += batch_products
+            products_created += batch_created
+            parameters_processed += batch_parameters
+
+        # Прайс-лист без товаров: магазин все равно очищается от старых товаров
+        if deleted_count is None:
+            deleted_count = _prepare_shop(shop, categories)
+
+        # bulk-операции не отправляют сигналы - кэш списков сбрасывается только после фиксации транзакции
+        transaction.on_commit(partial(invalidate_view_cache, CATEGORIES_CACHE_PREFIX))
+        transaction.on_commit(partial(invalidate_view_cache, PRODUCTS_CACHE_PREFIX))
+
+        return {
+            'status': 'success',
+            'message': 'Импорт товаров завершен',
+            'statistics': {
+                'categories_processed': len(categories),
+                'products_processed': products_processed,
+                'products_created': products_created,
+                'parameters_processed': parameters_processed,
+                'old_products_deleted': deleted_count,
+                'shop_id': shop_id,
+                'shop_name': shop.name
+            }
+        }
+
+
+@shared_task(bind=True, max_retries=3, time_limit=300, acks_late=True,
+             autoretry_for=(requests.RequestException,), retry_backoff=True)
 def do_import(self, shop_id, import_url):
     """
     Асинхронная задача для импорта товаров поставщика.
+
+    Импорт полностью заменяет товары магазина, поэтому повторное выполнение безопасно:
+    задача подтверждается после выполнения (acks_late) и при падении воркера выполняется заново.
     
     Args:
         shop_id: ID магазина поставщика
@@ -16,72 +153,14 @@ def do_import(self, shop_id, import_url):
         dict: Результат импорта товаров
     """
     try:
-        # Загрузка данных из YAML
-        data = load_yaml_from_url(import_url)
-        
-        with transaction.atomic():
-            shop = Shop.objects.get(id=shop_id)
-            
-            # Обработка категорий
-            categories_processed = 0
-            for category_data in data['categories']:
-                category, created = Category.objects.get_or_create(
-                    id=category_data['id'],
-                    defaults={'name': category_data['name']}
-                )
-                category.shops.add(shop)
-                category.save()
-                categories_processed += 1
-            
-            # Удаление старых товаров магазина
-            deleted_count = ProductInfo.objects.filter(shop=shop).delete()[0]
-            
-            # Обработка товаров
-            products_processed = 0
-            parameters_processed = 0
-            
-            for item in data['goods']:
-                product, created = Product.objects.get_or_create(
-                    name=item['name'],
-                    category_id=item['category']
-                )
-                
-                product_info = ProductInfo.objects.create(
-                    product=product,
-                    shop=shop,
-                    external_id=item['id'],
-                    model=item['model'],
-                    price=item['price'],
-                    price_rrc=item['price_rrc'],
-                    quantity=item['quantity']
-                )
-                
-                # Обработка параметров
-                for name, value in item.get('parameters', {}).items():
-                    parameter, created = Parameter.objects.get_or_create(name=name)
-                    ProductParameter.objects.create(
-                        product_info=product_info,
-                        parameter=parameter,
-                        value=str(value)
-                    )
-                    parameters_processed += 1
-                
-                products_processed += 1
-            
-            return {
-                'status': 'success',
-                'message': 'Импорт товаров завершен',
-                'statistics': {
-                    'categories_processed': categories_processed,
-                    'products_processed': products_processed,
-                    'parameters_processed': parameters_processed,
-                    'old_products_deleted': deleted_count,
-                    'shop_id': shop_id,
-                    'shop_name': shop.name
-                }
-            }
-    
+        return _import_shop(shop_id, import_url)
+    except requests.RequestException:
+        # Сетевые ошибки повторяются через autoretry_for с экспоненциально растущей задержкой
+        raise
+    except ValueError:
+        # Ошибка в структуре прайс-листа повторится при каждой попытке - повтор не нужен
+        raise
     except Exception as e:
         # Повторная попытка через 120 секунд
         raise self.retry(exc=e, countdown=120)
-    
\ No newline at end of file
+
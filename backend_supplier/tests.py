@@ -1,3 +1,30 @@
-from django.test import TestCase
+from unittest import mock
+from django.test import SimpleTestCase
+from . import tasks
 
-# Create your tests here.
+
+class IterGoodsBatchesTests(SimpleTestCase):
+    """
+    Тесты группировки товаров прайс-листа в пачки
+    """
+
+    @mock.patch.object(tasks, 'IMPORT_BATCH_SIZE', 2)
+    def test_goods_are_grouped_in_batches(self):
+        categories = []
+        items = [('categories', {'id': 1})] + [('goods', {'id': i}) for i in range(5)]
+        batches = list(tasks._iter_goods_batches(items, categories))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(categories, [{'id': 1}])
+
+    @mock.patch.object(tasks, 'IMPORT_BATCH_SIZE', 2)
+    def test_categories_after_goods_within_first_batch(self):
+        categories = []
+        items = [('goods', {'id': 1}), ('categories', {'id': 1})]
+        self.assertEqual(list(tasks._iter_goods_batches(items, categories)), [[{'id': 1}]])
+        self.assertEqual(categories, [{'id': 1}])
+
+    @mock.patch.object(tasks, 'IMPORT_BATCH_SIZE', 2)
+    def test_categories_after_first_batch_are_rejected(self):
+        items = [('goods', {'id': 1}), ('goods', {'id': 2}), ('categories', {'id': 1})]
+        with self.assertRaises(ValueError):
+            list(tasks._iter_goods_batches(items, []))
@@ -2,12 +2,32 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
-from django.db import transaction
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem
-from backend.utils import load_yaml_from_url
+from django.db.models import (
+    Count, DecimalField, Exists, F, Func, OuterRef, PositiveIntegerField, Prefetch, Subquery, Sum
+)
+from backend.models import Shop, ProductInfo, ProductParameter, Order, OrderItem, VALID_ORDER_STATES
+from backend.pagination import DtCursorPagination
+from .permissions import IsSupplierWithShop
 from .tasks import do_import
 
 
+def _count_subquery(queryset):
+    """
+    Функция построения скалярного подзапроса SELECT COUNT(*) по queryset
+
+    В отличие от Count с группировкой, для пустой выборки подзапрос возвращает 0, а не NULL.
+
+    Args:
+        queryset: QuerySet, строки которого считаются
+
+    Return:
+        Subquery: подзапрос с количеством строк
+    """
+    return Subquery(
+        queryset.order_by().annotate(count=Func(F('pk'), function='COUNT')).values('count'),
+        output_field=PositiveIntegerField()
+    )
+
 class SupplierUpdate(APIView):
     """
     API-endpoint для обновления прайс-листа поставщика
@@ -18,7 +38,7 @@ class SupplierUpdate(APIView):
     Методы:
         POST - загрузка и обновление прайс-листа
     """
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsSupplierWithShop]
 
     def post(self, request):
         """
@@ -30,21 +50,8 @@ class SupplierUpdate(APIView):
         Return:
             Response: JSON с результатом операции
         """
-        # Проверяется что пользователь - поставщик
-        if request.user.type != 'supplier':
-            return Response({
-                'Status': False,
-                'Error': 'Доступно только для поставщиков'
-            }, status=status.HTTP_403_FORBIDDEN)
-        
-        # Получается магазин пользователя
-        try:
-            shop = Shop.objects.get(user=request.user)
-        except Shop.DoesNotExist:
-            return Response({
-                'Status': False,
-                'Error': 'Магазин не найден для данного пользователя'
-            }, status=status.HTTP_404_NOT_FOUND)
+        # Магазин пользователя получен при проверке прав
+        shop = request.shop
         
         # Обрабатывается загрузка из URL
         url = request.data.get('url')
@@ -63,76 +70,6 @@ class SupplierUpdate(APIView):
             'Status': False,
             'Error': 'Не указан URL для загрузки'
         }, status=status.HTTP_400_BAD_REQUEST)
-    
-    def _import_price_data(self, data, shop):
-        """
-        Внутренний метод для импорта данных прайс-листа
-
-        Args:
-            data: Данные из YAML файла
-            shop: Магазин поставщика
-            
-        Return:
-            Response: JSON с результатом операции
-        """
-        try:
-            with transaction.atomic():
-                # Обработка категории
-                for category_data in data['categories']:
-                    category, created = Category.objects.get_or_create(
-                        id=category_data['id'],
-                        defaults={'name': category_data['name']}
-                    )
-                    category.shops.add(shop)
-                    category.save()
-                
-                # Удаление старыъ товаров магазина
-                ProductInfo.objects.filter(shop=shop).delete()
-                
-                # Обработка товаров
-                products_count = 0
-                for item in data['goods']:
-                    product, created = Product.objects.get_or_create(
-                        name=item['name'],
-                        category_id=item['category']
-                    )
-                    
-                    product_info = ProductInfo.objects.create(
-                        product=product,
-                        shop=shop,
-                        external_id=item['id'],
-                        model=item['model'],
-                        price=item['price'],
-                        price_rrc=item['price_rrc'],
-                        quantity=item['quantity']
-                    )
-                    
-                    # Обработка параметров
-                    for name, value in item.get('parameters', {}).items():
-                        parameter, created = Parameter.objects.get_or_create(name=name)
-                        ProductParameter.objects.create(
-                            product_info=product_info,
-                            parameter=parameter,
-                            value=str(value)
-                        )
-                    
-                    products_count += 1
-                
-                return Response({
-                    'Status': True,
-                    'Message': f'Прайс-лист обновлен. Обработано товаров: {products_count}'
-                })
-                
-        except KeyError as e:
-            return Response({
-                'Status': False,
-                'Error': f'Отсутствует обязательное поле в данных: {str(e)}'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            return Response({
-                'Status': False,
-                'Error': f'Ошибка импорта данных: {str(e)}'
-            }, status=status.HTTP_400_BAD_REQUEST)
 
 class SupplierOrders(APIView):
     """
@@ -144,7 +81,7 @@ class SupplierOrders(APIView):
     Методы:
         GET - получение списка заказов
     """
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsSupplierWithShop]
 
     def get(self, request):
         """
@@ -154,60 +91,50 @@ class SupplierOrders(APIView):
             request: HTTP запрос
             
         Return:
-            Response: JSON со списком заказов
+            Response: JSON со страницей заказов (next, previous, results)
         """
-        # Проверяется что пользователь - поставщик
-        if request.user.type != 'supplier':
-            return Response({
-                'Status': False,
-                'Error': 'Доступно только для поставщиков'
-            }, status=status.HTTP_403_FORBIDDEN)
+        # Магазин пользователя получен при проверке прав
+        shop = request.shop
         
-        # Получается магазин пользователя
-        try:
-            shop = Shop.objects.get(user=request.user)
-        except Shop.DoesNotExist:
-            return Response({
-                'Status': False,
-                'Error': 'Магазин не найден для данного пользователя'
-            }, status=status.HTTP_404_NOT_FOUND)
+        # Получаются заказы, содержащие товары данного магазина: EXISTS (полусоединение) вместо JOIN
+        # с позициями и группировки. Сумма и количество товаров поставщика считаются коррелированными
+        # подзапросами по позициям магазина, из покупателя и контакта через JOIN выбираются только выводимые колонки
+        supplier_items = OrderItem.objects.filter(order=OuterRef('pk'), product_info__shop=shop)
+        supplier_totals = supplier_items.values('order')
+        orders = Order.objects.filter(Exists(supplier_items)).exclude(status='basket').annotate(
+            total_amount=Subquery(
+                supplier_totals.annotate(total=Sum(F('quantity') * F('product_info__price'))).values('total'),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            ),
+            items_count=Subquery(supplier_totals.annotate(count=Count('pk')).values('count'))
+        ).values(
+            'id', 'dt', 'status', 'user__username', 'total_amount', 'items_count', 'contact__city', 'contact__phone'
+        )
         
-        # Получаются заказы, содержащие товары данного магазина
-        orders = Order.objects.filter(
-            ordered_items__product_info__shop=shop
-        ).exclude(status='basket').distinct().order_by('-dt')
+        # Заказы отдаются страницами курсорной пагинации по дате: выбирается не больше page_size строк
+        paginator = DtCursorPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
         
-        # Формируются данные для ответа
-        orders_data = []
-        for order in orders:
-            # Получаются только товары данного поставщика в заказе
-            supplier_items = OrderItem.objects.filter(
-                order=order,
-                product_info__shop=shop
-            )
-            
-            # Считается общая сумма товаров поставщика в заказе
-            total_amount = sum(
-                item.quantity * item.product_info.price 
-                for item in supplier_items
-            )
-            
-            order_info = {
-                'id': order.id,
-                'dt': order.dt,
-                'status': order.status,
-                'user': order.user.username,
-                'total_amount': total_amount,
-                'items_count': supplier_items.count(),
+        # Формируются данные для ответа из словарей строк, без создания объектов моделей.
+        # Decimal сразу приводится к float (так его выводит и JSON-энкодер DRF), чтобы рендерер
+        # не вызывал Python-обработчик для каждого значения
+        orders_data = [
+            {
+                'id': order['id'],
+                'dt': order['dt'],
+                'status': order['status'],
+                'user': order['user__username'],
+                'total_amount': float(order['total_amount']),
+                'items_count': order['items_count'],
                 'contact': {
-                    'city': order.contact.city if order.contact else None,
-                    'phone': order.contact.phone if order.contact else None
+                    'city': order['contact__city'],
+                    'phone': order['contact__phone']
                 }
             }
-            
-            orders_data.append(order_info)
+            for order in page
+        ]
         
-        return Response(orders_data)
+        return paginator.get_paginated_response(orders_data)
     
 # backend_supplier/views.py - ДОБАВИТЬ этот класс
 
@@ -222,7 +149,7 @@ class SupplierOrderDetail(APIView):
         GET - получение деталей заказа
         PATCH - обновление статуса заказа
     """
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsSupplierWithShop]
 
     def get(self, request, order_id):
         """
@@ -235,84 +162,86 @@ class SupplierOrderDetail(APIView):
         Return:
             Response: JSON с деталями заказа
         """
-        # Проверяется что пользователь - поставщик
-        if request.user.type != 'supplier':
-            return Response({
-                'Status': False,
-                'Error': 'Доступно только для поставщиков'
-            }, status=status.HTTP_403_FORBIDDEN)
-        
-        try:
-            shop = Shop.objects.get(user=request.user)
-            order = Order.objects.get(id=order_id)
-            
-            # Проверяется что заказ содержит товары данного поставщика
-            supplier_items = OrderItem.objects.filter(
-                order=order,
-                product_info__shop=shop
-            )
-            
-            if not supplier_items.exists():
-                return Response({
-                    'Status': False,
-                    'Error': 'Заказ не содержит товаров данного магазина'
-                }, status=status.HTTP_404_NOT_FOUND)
-            
-            # Формируется детальная информация
-            order_detail = {
-                'id': order.id,
-                'dt': order.dt,
-                'status': order.status,
-                'user': {
-                    'username': order.user.username,
-                    'email': order.user.email,
-                    'first_name': order.user.first_name,
-                    'last_name': order.user.last_name,
-                    'company': order.user.company
-                },
-                'contact': {
-                    'city': order.contact.city,
-                    'street': order.contact.street,
-                    'house': order.contact.house,
-                    'apartment': order.contact.apartment,
-                    'phone': order.contact.phone
-                } if order.contact else None,
-                'items': []
-            }
-            
-            for item in supplier_items:
-                item_info = {
-                    'id': item.id,
-                    'product_name': item.product_info.product.name,
-                    'model': item.product_info.model,
-                    'quantity': item.quantity,
-                    'price': item.product_info.price,
-                    'total': item.quantity * item.product_info.price
-                }
-                
-                # Добавляются параметры товара если есть
-                parameters = item.product_info.product_parameters.all()
-                if parameters.exists():
-                    item_info['parameters'] = [
-                        {'name': param.parameter.name, 'value': param.value}
-                        for param in parameters
-                    ]
-                
-                order_detail['items'].append(item_info)
-            
-            return Response(order_detail)
-            
-        except Shop.DoesNotExist:
+        shop = request.shop
+        # Заказ, покупатель и контакт выбираются одним запросом только с выводимыми колонками
+        order = Order.objects.select_related('user', 'contact').only(
+            'id', 'dt', 'status',
+            'user__username', 'user__email', 'user__first_name', 'user__last_name', 'user__company',
+            'contact__city', 'contact__street', 'contact__house', 'contact__apartment', 'contact__phone'
+        ).filter(id=order_id).first()
+        if order is None:
             return Response({
                 'Status': False,
-                'Error': 'Магазин не найден'
+                'Error': 'Заказ не найден'
             }, status=status.HTTP_404_NOT_FOUND)
-        except Order.DoesNotExist:
+
+        # Товары поставщика выбираются один раз вместе с продуктами, параметры - одним prefetch-запросом.
+        # Выбираются только выводимые колонки (product_info_id нужен для раскладки параметров по товарам)
+        supplier_items = list(OrderItem.objects.filter(
+            order=order,
+            product_info__shop=shop
+        ).select_related('product_info__product').only(
+            'id', 'quantity', 'product_info__model', 'product_info__price', 'product_info__product__name'
+        ).prefetch_related(
+            Prefetch('product_info__product_parameters',
+                     queryset=ProductParameter.objects.select_related('parameter').only(
+                         'product_info_id', 'value', 'parameter__name'
+                     ))
+        ))
+
+        # Проверяется что заказ содержит товары данного поставщика
+        if not supplier_items:
             return Response({
                 'Status': False,
-                'Error': 'Заказ не найден'
+                'Error': 'Заказ не содержит товаров данного магазина'
             }, status=status.HTTP_404_NOT_FOUND)
 
+        # Формируется детальная информация
+        order_detail = {
+            'id': order.id,
+            'dt': order.dt,
+            'status': order.status,
+            'user': {
+                'username': order.user.username,
+                'email': order.user.email,
+                'first_name': order.user.first_name,
+                'last_name': order.user.last_name,
+                'company': order.user.company
+            },
+            'contact': {
+                'city': order.contact.city,
+                'street': order.contact.street,
+                'house': order.contact.house,
+                'apartment': order.contact.apartment,
+                'phone': order.contact.phone
+            } if order.contact else None,
+            'items': []
+        }
+
+        for item in supplier_items:
+            # Цена и сумма приводятся к float здесь, как и в списке заказов
+            price = item.product_info.price
+            item_info = {
+                'id': item.id,
+                'product_name': item.product_info.product.name,
+                'model': item.product_info.model,
+                'quantity': item.quantity,
+                'price': float(price),
+                'total': float(item.quantity * price)
+            }
+
+            # Добавляются параметры товара если есть
+            parameters = item.product_info.product_parameters.all()
+            if parameters:
+                item_info['parameters'] = [
+                    {'name': param.parameter.name, 'value': param.value}
+                    for param in parameters
+                ]
+
+            order_detail['items'].append(item_info)
+
+        return Response(order_detail)
+
     def patch(self, request, order_id):
         """
         Обновление статуса заказа поставщиком
@@ -324,54 +253,30 @@ class SupplierOrderDetail(APIView):
         Return:
             Response: JSON с результатом операции
         """
-        # Проверяется что пользователь - поставщик
-        if request.user.type != 'supplier':
+        new_status = request.data.get('status')
+        if new_status not in VALID_ORDER_STATES:
             return Response({
                 'Status': False,
-                'Error': 'Доступно только для поставщиков'
-            }, status=status.HTTP_403_FORBIDDEN)
-        
-        try:
-            shop = Shop.objects.get(user=request.user)
-            order = Order.objects.get(id=order_id)
-            
-            # Проверяется что заказ содержит товары данного поставщика
-            supplier_items = OrderItem.objects.filter(
-                order=order,
-                product_info__shop=shop
-            )
-            
-            if not supplier_items.exists():
-                return Response({
-                    'Status': False,
-                    'Error': 'Заказ не содержит товаров данного магазина'
-                }, status=status.HTTP_404_NOT_FOUND)
-            
-            new_status = request.data.get('status')
-            if new_status and new_status in dict(Order.STATE_CHOISES):
-                order.status = new_status
-                order.save()
-                
-                return Response({
-                    'Status': True,
-                    'Message': f'Статус заказа обновлен на: {new_status}'
-                })
-            else:
-                return Response({
-                    'Status': False,
-                    'Error': 'Неверный статус'
-                }, status=status.HTTP_400_BAD_REQUEST)
-                
-        except Shop.DoesNotExist:
-            return Response({
-                'Status': False,
-                'Error': 'Магазин не найден'
-            }, status=status.HTTP_404_NOT_FOUND)
-        except Order.DoesNotExist:
+                'Error': 'Неверный статус'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Проверка наличия заказа, проверка что он содержит товары данного поставщика
+        # и обновление статуса выполняются одним UPDATE
+        updated = Order.objects.filter(
+            Exists(OrderItem.objects.filter(order=OuterRef('pk'), product_info__shop=request.shop)),
+            id=order_id
+        ).update(status=new_status)
+
+        if not updated:
             return Response({
                 'Status': False,
-                'Error': 'Заказ не найден'
+                'Error': 'Заказ не найден или не содержит товаров данного магазина'
             }, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'Status': True,
+            'Message': f'Статус заказа обновлен на: {new_status}'
+        })
         
 # backend_supplier/views.py - ДОБАВИТЬ этот класс
 
@@ -386,7 +291,7 @@ class SupplierState(APIView):
         GET - получение текущего состояния
         PATCH - обновление состояния
     """
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsSupplierWithShop]
 
     def get(self, request):
         """
@@ -398,42 +303,27 @@ class SupplierState(APIView):
         Return:
             Response: JSON с состоянием магазина
         """
-        # Проверяется что пользователь - поставщик
-        if request.user.type != 'supplier':
-            return Response({
-                'Status': False,
-                'Error': 'Доступно только для поставщиков'
-            }, status=status.HTTP_403_FORBIDDEN)
-        
-        try:
-            shop = Shop.objects.get(user=request.user)
-            
-            # Считается количество активных товаров
-            active_products_count = ProductInfo.objects.filter(
-                shop=shop, 
-                quantity__gt=0
-            ).count()
-            
-            # Считается количество заказов в работе
-            active_orders_count = Order.objects.filter(
-                ordered_items__product_info__shop=shop
-            ).exclude(status__in=['basket', 'delivered', 'canceled']).distinct().count()
-            
-            return Response({
-                'Status': True,
-                'shop_name': shop.name,
-                'is_active': shop.is_active,
-                'statistics': {
-                    'active_products': active_products_count,
-                    'active_orders': active_orders_count,
-                    'total_products': ProductInfo.objects.filter(shop=shop).count()
-                }
-            })
-        except Shop.DoesNotExist:
-            return Response({
-                'Status': False,
-                'Error': 'Магазин не найден'
-            }, status=status.HTTP_404_NOT_FOUND)
+        shop = request.shop
+
+        products = ProductInfo.objects.filter(shop=shop)
+        # Заказы в работе, содержащие товары магазина. EXISTS вместо JOIN + DISTINCT
+        active_orders = Order.objects.filter(
+            Exists(OrderItem.objects.filter(order=OuterRef('pk'), product_info__shop=shop))
+        ).exclude(status__in=['basket', 'delivered', 'canceled'])
+
+        # Счетчики независимы, поэтому считаются подзапросами одного SELECT - за один обход БД
+        statistics = Shop.objects.filter(pk=shop.pk).values(
+            active_products=_count_subquery(products.filter(quantity__gt=0)),
+            active_orders=_count_subquery(active_orders),
+            total_products=_count_subquery(products)
+        ).get()
+
+        return Response({
+            'Status': True,
+            'shop_name': shop.name,
+            'is_active': shop.is_active,
+            'statistics': statistics
+        })
 
     def patch(self, request):
         """
@@ -445,37 +335,23 @@ class SupplierState(APIView):
         Return:
             Response: JSON с результатом операции
         """
-        # Проверяется что пользователь - поставщик
-        if request.user.type != 'supplier':
+        shop = request.shop
+        is_active = request.data.get('is_active')
+
+        if is_active is not None:
+            shop.is_active = is_active
+            shop.save()
+
+            state = 'включен' if is_active else 'выключен'
             return Response({
-                'Status': False,
-                'Error': 'Доступно только для поставщиков'
-            }, status=status.HTTP_403_FORBIDDEN)
-        
-        try:
-            shop = Shop.objects.get(user=request.user)
-            is_active = request.data.get('is_active')
-            
-            if is_active is not None:
-                shop.is_active = is_active
-                shop.save()
-                
-                state = 'включен' if is_active else 'выключен'
-                return Response({
-                    'Status': True,
-                    'Message': f'Прием заказов {state}'
-                })
-            else:
-                return Response({
-                    'Status': False,
-                    'Error': 'Не указан параметр is_active'
-                }, status=status.HTTP_400_BAD_REQUEST)
-                
-        except Shop.DoesNotExist:
+                'Status': True,
+                'Message': f'Прием заказов {state}'
+            })
+        else:
             return Response({
                 'Status': False,
-                'Error': 'Магазин не найден'
-            }, status=status.HTTP_404_NOT_FOUND)
+                'Error': 'Не указан параметр is_active'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
 class SupplierImportView(APIView):
     """
@@ -512,22 +388,20 @@ class SupplierImportView(APIView):
                 'Error': 'Не указаны shop_id или import_url'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            shop = Shop.objects.get(id=shop_id)
-            
-            # Асинхронный импорт через Celery
-            task = do_import.delay(shop_id=shop.id, import_url=import_url)
-            
-            return Response({
-                'Status': True,
-                'Message': f'Импорт товаров для магазина "{shop.name}" запущен',
-                'TaskID': task.id,
-                'ShopID': shop.id,
-                'ShopName': shop.name
-            })
-            
-        except Shop.DoesNotExist:
+        shop = Shop.objects.filter(id=shop_id).only('id', 'name').first()
+        if shop is None:
             return Response({
                 'Status': False,
                 'Error': 'Магазин не найден'
             }, status=status.HTTP_404_NOT_FOUND)
+
+        # Асинхронный импорт через Celery
+        task = do_import.delay(shop_id=shop.id, import_url=import_url)
+
+        return Response({
+            'Status': True,
+            'Message': f'Импорт товаров для магазина "{shop.name}" запущен',
+            'TaskID': task.id,
+            'ShopID': shop.id,
+            'ShopName': shop.name
+        })
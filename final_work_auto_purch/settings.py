@@ -90,10 +90,28 @@ DATABASES = {
         'PASSWORD': getenv('DB_PASSWORD'),
         'HOST': getenv('DB_HOST'),
         'PORT': getenv('DB_PORT'),
+        # Транзакции открываются только в изменяющих данные представлениях
+        'ATOMIC_REQUESTS': False,
+        # Постоянные подключения: соединение с БД переиспользуется между запросами (по умолчанию до 10 минут),
+        # перед повторным использованием проверяется его работоспособность
+        'CONN_MAX_AGE': int(getenv('DB_CONN_MAX_AGE') or 600),
+        'CONN_HEALTH_CHECKS': True,
+        # За PgBouncer в режиме transaction серверные курсоры (iterator()) нужно отключать
+        'DISABLE_SERVER_SIDE_CURSORS': getenv('DB_DISABLE_SERVER_SIDE_CURSORS', 'False') == 'True',
     }
 }
 
 
+# Argon2id - основной хешер паролей, остальные оставлены для проверки уже сохраненных хешей
+# (при входе такие пароли перехешируются в Argon2)
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -137,25 +155,62 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'backend.User'
 
+AUTHENTICATION_BACKENDS = [
+    'backend.authentication.CachedModelBackend',
+]
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'backend.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'backend.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': getenv('REDIS_URL') or 'redis://localhost:6379/1',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+    }
+}
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 CELERY_BROKER_URL = getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = getenv('CELERY_RESULT_BACKEND', 'django-db')
-CELERY_ACCEPT_CONTENT = ['json']
-CELERY_TASK_SERIALIZER = 'json'
-CELERY_RESULT_SERIALIZER = 'json'
+# msgpack компактнее и быстрее JSON, JSON оставлен для приема сообщений старого формата
+CELERY_ACCEPT_CONTENT = ['msgpack', 'json']
+CELERY_RESULT_ACCEPT_CONTENT = ['msgpack', 'json']
+CELERY_TASK_SERIALIZER = 'msgpack'
+CELERY_RESULT_SERIALIZER = 'msgpack'
+CELERY_TASK_COMPRESSION = 'gzip'
+CELERY_RESULT_COMPRESSION = 'gzip'
 CELERY_TIMEZONE = 'Europe/Moscow'
+# Воркер берет по одной задаче на процесс, чтобы долгий импорт не задерживал уже полученные задачи.
+# Используется пул prefork: только в нем действуют time_limit задач. Количество процессов
+# по умолчанию равно числу ядер
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_WORKER_CONCURRENCY = int(getenv('CELERY_WORKER_CONCURRENCY') or 0) or None
+CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
+
+# Периодические задачи Celery beat
+CELERY_BEAT_SCHEDULE = {
+    # Пакетная отправка накопившихся писем подтверждения заказов
+    'send-order-confirmation-emails': {
+        'task': 'backend.tasks.send_order_confirmation_emails_batch',
+        'schedule': 5.0,
+    },
+}
 
 CELERY_EMAIL_TASK_CONFIG = {
     'queue': 'email',